@@ -0,0 +1,119 @@
+"""Parity check and benchmark of the polars return engine against the SQL one.
+
+Seeds the same synthetic data as `sql_harness.py`, materializes holding, fund and
+all-fund returns with the `*_materialize.sql` scripts and with `tools.returns`,
+and compares the two row by row. The SQL side runs as a reload up to the day
+before the last, then as a daily run of the last day, which carries the prior
+day forward through holding_state. The polars results are then merged over the
+SQL ones, printing how many rows land on the other side of a rounding boundary
+and are rewritten. Exits with status 1 when a row is missing from either side, a
+value differs by more than the tolerance, or the merge inserts a row.
+
+Usage (from the repository root, against a throwaway database):
+
+    python benchmarks/returns_parity.py --throwaway
+    python benchmarks/returns_parity.py --throwaway --days 1000 --symbols 200
+"""
+import argparse
+import os
+import sys
+import time
+import polars as pl
+
+from sql_harness import MATERIALIZE_PARAMS, SCHEMA, SQL_DIR, add_database_arguments, connect, seed, seed_data, trading_days
+
+import aws
+import tools
+
+# Key and value columns of each returns table.
+TABLES = {
+    'holding_returns': (['date', 'client_account_id', 'ticker'], ['weight', 'shares', 'price', 'value', 'shares_traded', 'average_trade_price', 'return', 'dividends', 'dividends_per_share']),
+    'fund_returns': (['date', 'client_account_id'], ['value', 'return', 'dividends']),
+    'all_fund_returns': (['date'], ['value', 'return', 'dividends']),
+}
+
+def run_sql(db: aws.RDS, name: str, start_date, end_date) -> float:
+    start = time.perf_counter()
+    db.execute_merge_template_file(os.path.join(SQL_DIR, f"{name}_materialize.sql"), {'start_date': start_date, 'end_date': end_date, **MATERIALIZE_PARAMS[name]})
+    return time.perf_counter() - start
+
+def run_polars(data: dict[str, pl.DataFrame], name: str, start_date, end_date) -> tuple[pl.DataFrame, float]:
+    calendar = data['calendar'].lazy()
+
+    start = time.perf_counter()
+    if name == 'holding_returns':
+        lf = tools.holding_returns(data['positions'].lazy(), data['trades'].lazy(), data['dividends'].lazy(), calendar, start_date, end_date)
+    elif name == 'fund_returns':
+        lf = tools.fund_returns(data['delta_nav'].lazy(), calendar, start_date, end_date)
+    else:
+        lf = tools.all_fund_returns(data['delta_nav'].lazy(), calendar, start_date, end_date)
+
+    df = lf.collect()
+    elapsed = time.perf_counter() - start
+
+    return df, elapsed
+
+def compare(sql: pl.DataFrame, engine: pl.DataFrame, keys: list[str], values: list[str], tolerance: float) -> list[str]:
+    """Row count differences, and values differing by more than the relative tolerance."""
+    def prepare(df: pl.DataFrame) -> pl.DataFrame:
+        return df.select(*keys, pl.col(values).cast(pl.Float64))
+
+    joined = prepare(sql).join(prepare(engine), on=keys, how='full', coalesce=True, suffix='_engine')
+    mismatches = []
+
+    if joined.height != sql.height or joined.height != engine.height:
+        mismatches.append(f"row counts differ: sql {sql.height}, engine {engine.height}, joined {joined.height}")
+
+    for value in values:
+        difference = (pl.col(value) - pl.col(f"{value}_engine")).abs()
+        scale = pl.max_horizontal(pl.col(value).abs(), pl.col(f"{value}_engine").abs(), pl.lit(1.0))
+        differing = joined.filter((difference / scale > tolerance) | (pl.col(value).is_null() != pl.col(f"{value}_engine").is_null()))
+
+        if not differing.is_empty():
+            mismatches.append(f"{value}: {differing.height} rows differ, e.g. {differing.select(*keys, value, f'{value}_engine').row(0)}")
+
+    return mismatches
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_arguments(parser)
+    parser.add_argument('--days', type=int, default=250, help="Trading days of data to seed.")
+    parser.add_argument('--symbols', type=int, default=50, help="Symbols held per account.")
+    parser.add_argument('--tolerance', type=float, default=1e-6, help="Allowed relative difference between the engines (values are rounded to 6 places).")
+    args = parser.parse_args()
+
+    db = connect(args)
+
+    dates = trading_days(args.days)
+    data = seed_data(dates, args.symbols)
+    seed(db, data)
+
+    failures = []
+    print(f"{'table':<20} {'rows':>10} {'sql s':>10} {'daily s':>10} {'polars s':>10} {'speedup':>8}")
+    for name, (keys, values) in TABLES.items():
+        # Reload all but the last day, then run the last day on its own like the daily DAG.
+        sql_seconds = run_sql(db, name, dates[0], dates[-2])
+        daily_seconds = run_sql(db, name, dates[-1], dates[-1])
+        sql = db.execute_to_df(f'SELECT * FROM {SCHEMA}.{name};')
+
+        engine, engine_seconds = run_polars(data, name, dates[0], dates[-1])
+
+        print(f"{name:<20} {sql.height:>10} {sql_seconds:>10.3f} {daily_seconds:>10.3f} {engine_seconds:>10.3f} {sql_seconds / engine_seconds:>7.1f}x")
+
+        failures += [f"{name}: {mismatch}" for mismatch in compare(sql, engine, keys, values, args.tolerance)]
+
+        # A polars reload over SQL results only rewrites rows whose rounding differs (the merges skip rows that are not distinct).
+        counts = db.stage_and_merge(engine, f"PARITY_{name.upper()}", os.path.join(SQL_DIR, f"{name}_merge.sql"))
+        print(f"{name:<20} polars merge rewrote {counts['updated']} of {engine.height} rows")
+
+        if counts['inserted']:
+            failures.append(f"{name}: polars merge inserted {counts['inserted']} rows")
+
+    for failure in failures:
+        print(f"Mismatch: {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""EXPLAIN ANALYZE regression harness for the SQL layer.
+
+Seeds a local Postgres with synthetic IBKR data, runs every merge and materialize
+script under `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`, recommends indexes for
+sequential scans that discard most of their rows, and compares plan cost and runtime
+against a saved baseline. Exits with status 1 when a script regresses past the
+threshold.
+
+Usage (from the repository root, against a throwaway database):
+
+    python benchmarks/sql_harness.py --throwaway --update-baseline
+    python benchmarks/sql_harness.py --throwaway --create-indexes
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import re
+import sys
+import polars as pl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dags'))
+
+import aws
+from aws.sql_catalog import catalog
+
+SQL_DIR = 'dags/sql'
+SCHEMA = 'sql_harness'
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql_baseline.json')
+
+ACCOUNTS = ['U0000001', 'U0000002', 'U0000003', 'U0000004']
+SUB_CATEGORIES = ['COMMON', 'COMMON', 'COMMON', 'ETF', 'ADR', 'PREFERRED']
+
+# Tables partitioned by month, with the column they are partitioned on.
+PARTITIONED_TABLES = {
+    'positions': ('positions_new', 'report_date'),
+    'trades': ('trades_new', 'report_date'),
+    'dividends': ('dividends_new', 'report_date'),
+    'holding_returns': ('holding_returns', 'date'),
+}
+
+# Bind parameters of each materialize script besides its date window.
+MATERIALIZE_PARAMS = {
+    'holding_returns': {'accounts': None, 'carry_state': True},
+    'fund_returns': {'accounts': None},
+    'all_fund_returns': {},
+}
+
+# Bind parameters of a reload shard (see tasks/return_materialization_sub_tasks/sharded_reload.py).
+SHARD_PARAMS = {
+    'holding_returns': {'accounts': [ACCOUNTS[0]], 'carry_state': False},
+    'fund_returns': {'accounts': [ACCOUNTS[0]]},
+    'all_fund_returns': {},
+}
+
+# A sequential scan that removes at least this share of the rows it reads gets an index recommendation.
+FILTER_RATIO = 0.9
+
+def trading_days(days: int) -> list[dt.date]:
+    end_date = dt.date.today() - dt.timedelta(days=1)
+    dates = []
+    date = end_date
+    while len(dates) < days:
+        if date.weekday() < 5:
+            dates.append(date)
+        date -= dt.timedelta(days=1)
+
+    return sorted(dates)
+
+def seed_data(dates: list[dt.date], symbols: int) -> dict[str, pl.DataFrame]:
+    """Synthetic data for every staged dataset, in the shape the clean_* functions produce."""
+    rng = random.Random(0)
+    tickers = [f"T{i:03d}" for i in range(symbols)]
+    categories = {ticker: rng.choice(SUB_CATEGORIES) for ticker in tickers}
+
+    positions, trades, dividends = [], [], []
+    for account in ACCOUNTS:
+        for ticker in tickers:
+            price = rng.uniform(10, 500)
+            quantity = rng.choice([-1, 1]) * rng.randint(1, 1000)
+
+            for date in dates:
+                price *= 1 + rng.gauss(0, 0.02)
+                row = {
+                    'report_date': date,
+                    'client_account_id': account,
+                    'asset_class': 'STK',
+                    'sub_category': categories[ticker],
+                    'description': f"{ticker} INC",
+                    'cusip': None,
+                    'isin': None,
+                    'symbol': ticker,
+                }
+
+                if rng.random() < 0.05:
+                    traded = rng.randint(-100, 100) or 1
+                    quantity += traded
+                    trades.append({**row, 'trade_id': f"{account}{ticker}{date:%Y%m%d}", 'quantity': float(traded), 'trade_price': price, 'ib_commission': -1.0, 'buy_sell': 'BUY' if traded > 0 else 'SELL'})
+
+                if rng.random() < 0.01:
+                    rate = rng.uniform(0.1, 2)
+                    dividends.append({**row, 'action_id': f"{account}{ticker}{date:%Y%m%d}", 'ex_date': date, 'pay_date': date + dt.timedelta(days=14), 'quantity': float(quantity), 'gross_rate': rate, 'gross_amount': rate * quantity, 'tax': 0.0, 'fee': 0.0, 'net_amount': rate * quantity})
+
+                positions.append({**row, 'mark_price': price, 'quantity': float(quantity), 'fx_rate_to_base': 1.0})
+
+    delta_nav = []
+    for account in ACCOUNTS:
+        value = 1_000_000.0
+        for date in dates:
+            starting_value, value = value, value * (1 + rng.gauss(0, 0.01))
+            delta_nav.append({'date': date, 'client_account_id': account, 'starting_value': starting_value, 'ending_value': value, 'deposits_withdrawals': 0.0, 'dividends': 0.0})
+
+    return {
+        'calendar': pl.DataFrame({'date': dates}),
+        'risk_free_rate': pl.DataFrame({'date': dates, 'return': [0.0001] * len(dates)}),
+        'benchmark': pl.DataFrame({'date': dates, 'ticker': ['IWV'] * len(dates), 'adjusted_close': [rng.uniform(300, 400) for _ in dates], 'return': [rng.gauss(0, 0.01) for _ in dates], 'dividends_per_share': [0.0] * len(dates)}),
+        'positions': pl.DataFrame(positions),
+        'trades': pl.DataFrame(trades),
+        'dividends': pl.DataFrame(dividends),
+        'delta_nav': pl.DataFrame(delta_nav),
+    }
+
+def create_tables(db: aws.RDS) -> None:
+    for file_name in sorted(os.listdir(SQL_DIR)):
+        if not file_name.endswith('_create.sql'):
+            continue
+
+        name = file_name.removesuffix('_create.sql')
+
+        if name in PARTITIONED_TABLES:
+            db.create_partitioned_table(os.path.join(SQL_DIR, file_name), *PARTITIONED_TABLES[name])
+        else:
+            db.execute_sql_file(os.path.join(SQL_DIR, file_name))
+
+def add_database_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--host', default=os.getenv('HARNESS_DB_ENDPOINT', 'localhost'))
+    parser.add_argument('--port', default=os.getenv('HARNESS_DB_PORT', '5432'))
+    parser.add_argument('--dbname', default=os.getenv('HARNESS_DB_NAME', 'airflow'))
+    parser.add_argument('--user', default=os.getenv('HARNESS_DB_USER', 'airflow'))
+    parser.add_argument('--password', default=os.getenv('HARNESS_DB_PASSWORD', 'airflow'))
+    parser.add_argument('--throwaway', action='store_true', help="Confirm the database is disposable. Required.")
+
+def connect(args: argparse.Namespace) -> aws.RDS:
+    """Connect to the target database, refusing any that is not explicitly a throwaway one.
+
+    The database must be confirmed with --throwaway and must not hold any of the
+    pipeline's tables outside the harness schema.
+    """
+    if not args.throwaway:
+        raise Exception(f"Refusing to seed {args.dbname}: pass --throwaway to confirm it is a disposable database")
+
+    db = aws.RDS(db_endpoint=args.host, db_name=args.dbname, db_user=args.user, db_password=args.password, db_port=args.port)
+
+    tables = [file_name.removesuffix('_create.sql') for file_name in os.listdir(SQL_DIR) if file_name.endswith('_create.sql')]
+    candidates = tables + [f"{table}_new" for table in tables]
+    pipeline_tables = db.execute(
+        f"SELECT table_schema || '.' || table_name FROM information_schema.tables "
+        f"WHERE table_schema NOT IN ('{SCHEMA}', 'pg_catalog', 'information_schema') "
+        f"AND table_name IN ({', '.join(repr(table) for table in candidates)});"
+    )
+
+    if pipeline_tables:
+        raise Exception(f"Refusing to seed {args.dbname}: it holds pipeline tables", sorted(row[0] for row in pipeline_tables))
+
+    return db
+
+def seed(db: aws.RDS, data: dict[str, pl.DataFrame]) -> None:
+    db.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;')
+    db.execute(f'CREATE SCHEMA {SCHEMA};')
+    # Only the harness schema, so unqualified names can never resolve to the pipeline's tables.
+    db.execute(f'SET search_path TO {SCHEMA};')
+
+    create_tables(db)
+
+    for name, df in data.items():
+        db.stage_and_merge(df, f"SEED_{name.upper()}", os.path.join(SQL_DIR, f"{name}_merge.sql"), partition_by=PARTITIONED_TABLES.get(name))
+
+    db.execute('ANALYZE;')
+
+def explain(db: aws.RDS, file_name: str, params: dict, stage: pl.DataFrame = None) -> dict:
+    """Run a script under EXPLAIN ANALYZE and roll it back, so every run sees the same data."""
+    sql = catalog.render(file_name, params).strip().rstrip(';')
+
+    try:
+        if stage is not None:
+            db._stage(stage, params['stage_table'], 'TEMP')
+
+        db.cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)\n{sql}', params)
+        result = db.cursor.fetchone()[0]
+
+    finally:
+        db.connection.rollback()
+
+    if isinstance(result, str):
+        result = json.loads(result)
+
+    return result[0]
+
+def walk(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+def recommend_indexes(db: aws.RDS, plan: dict) -> list[str]:
+    """Recommend indexes for sequential scans that filter out most of the rows they read."""
+    recommendations = []
+
+    for node in walk(plan['Plan']):
+        if node['Node Type'] != 'Seq Scan' or 'Filter' not in node:
+            continue
+
+        removed = node.get('Rows Removed by Filter', 0)
+        returned = node.get('Actual Rows', 0)
+
+        if removed == 0 or removed < FILTER_RATIO * (removed + returned):
+            continue
+
+        table = node['Relation Name']
+        db.cursor.execute('SELECT column_name FROM information_schema.columns WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position;', (SCHEMA, table))
+        table_columns = [row[0] for row in db.cursor.fetchall()]
+        db.connection.rollback()
+
+        # Equality columns first, then range columns, in the order they appear in the filter.
+        columns = sorted(
+            (column for column in table_columns if re.search(rf'\b{column}\b', node['Filter'])),
+            key=lambda column: (not re.search(rf'\b{column}\b\s*(=|IN|= ANY)', node['Filter']), node['Filter'].index(column)),
+        )
+
+        if columns:
+            # Partitions inherit indexes created on their parent.
+            parent = re.sub(r'_\d{4}_\d{2}$', '', table)
+            recommendations.append(f'CREATE INDEX IF NOT EXISTS {parent}_{"_".join(columns)}_idx ON {parent} ({", ".join(columns)});')
+
+    return sorted(set(recommendations))
+
+def scripts(dates: list[dt.date], data: dict[str, pl.DataFrame]) -> dict[str, tuple[dict, pl.DataFrame | None]]:
+    """Every merge and materialize script, with the parameters and stage data to run it with."""
+    last_date = dates[-1]
+    runs = {}
+
+    for name, df in data.items():
+        date_column = 'report_date' if 'report_date' in df.columns else 'date'
+        runs[f"{name}_merge.sql"] = ({'stage_table': f"HARNESS_{name.upper()}"}, df.filter(pl.col(date_column).eq(last_date)))
+
+    for name, params in MATERIALIZE_PARAMS.items():
+        runs[f"{name}_materialize.sql[daily]"] = ({'start_date': last_date, 'end_date': last_date, **params}, None)
+        runs[f"{name}_materialize.sql[reload]"] = ({'start_date': dates[0], 'end_date': last_date, **params}, None)
+        runs[f"{name}_materialize.sql[shard]"] = ({'start_date': last_date.replace(day=1), 'end_date': last_date, **SHARD_PARAMS[name]}, None)
+
+    return runs
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_arguments(parser)
+    parser.add_argument('--days', type=int, default=250, help="Trading days of data to seed.")
+    parser.add_argument('--symbols', type=int, default=50, help="Symbols held per account.")
+    parser.add_argument('--cost-threshold', type=float, default=0.2, help="Allowed relative increase in total plan cost.")
+    parser.add_argument('--time-threshold', type=float, default=0.5, help="Allowed relative increase in execution time.")
+    parser.add_argument('--create-indexes', action='store_true', help="Create recommended indexes and rerun.")
+    parser.add_argument('--update-baseline', action='store_true', help="Save this run as the new baseline.")
+    args = parser.parse_args()
+
+    db = connect(args)
+
+    dates = trading_days(args.days)
+    data = seed_data(dates, args.symbols)
+    seed(db, data)
+
+    runs = scripts(dates, data)
+
+    def run_all() -> tuple[dict[str, dict], list[str]]:
+        results, recommendations = {}, []
+        for name, (params, stage) in runs.items():
+            plan = explain(db, os.path.join(SQL_DIR, name.split('[')[0]), params, stage)
+            results[name] = {
+                'total_cost': plan['Plan']['Total Cost'],
+                'execution_ms': plan['Execution Time'],
+                'planning_ms': plan['Planning Time'],
+                'shared_hit_blocks': plan['Plan'].get('Shared Hit Blocks', 0),
+                'shared_read_blocks': plan['Plan'].get('Shared Read Blocks', 0),
+            }
+            recommendations += recommend_indexes(db, plan)
+
+        return results, sorted(set(recommendations))
+
+    results, recommendations = run_all()
+
+    if recommendations and args.create_indexes:
+        for statement in recommendations:
+            print(f"Creating: {statement}")
+            db.execute(statement)
+
+        db.execute('ANALYZE;')
+        results, recommendations = run_all()
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'r') as file:
+            baseline = json.load(file)
+
+    regressions = []
+    print(f"{'script':<45} {'cost':>12} {'ms':>10} {'hit':>8} {'read':>8}")
+    for name, result in results.items():
+        print(f"{name:<45} {result['total_cost']:>12.1f} {result['execution_ms']:>10.1f} {result['shared_hit_blocks']:>8} {result['shared_read_blocks']:>8}")
+
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+
+        if result['total_cost'] > previous['total_cost'] * (1 + args.cost_threshold):
+            regressions.append(f"{name}: plan cost {previous['total_cost']:.1f} -> {result['total_cost']:.1f}")
+
+        if result['execution_ms'] > previous['execution_ms'] * (1 + args.time_threshold):
+            regressions.append(f"{name}: execution time {previous['execution_ms']:.1f}ms -> {result['execution_ms']:.1f}ms")
+
+    for statement in recommendations:
+        print(f"Recommended index: {statement}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Saved baseline to {BASELINE_PATH}")
+        return 0
+
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,102 @@
+import datetime as dt
+import functools
+import importlib.util
+import io
+import os
+import tempfile
+import uuid
+from typing import Iterator
+from urllib.parse import quote
 import polars as pl
 from sqlalchemy import create_engine
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from rich import print
-import jinja2
+from .sql_catalog import catalog
+
+# The ADBC read path needs both the driver and pyarrow (`adbc-driver-postgresql[dbapi]`).
+try:
+    import adbc_driver_postgresql.dbapi as adbc
+
+    if importlib.util.find_spec('pyarrow') is None:
+        raise ImportError("pyarrow is not installed")
+except ImportError:
+    adbc = None
+
+# Connection pool settings shared by every RDS instance in a process.
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 4))
+CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 10))
+
+# Rows fetched per batch by RDS.iter_batches.
+READ_BATCH_SIZE = int(os.getenv('DB_READ_BATCH_SIZE', 100_000))
+
+# Rows copied into a stage table per COPY statement.
+STAGE_BATCH_SIZE = 100_000
+
+# Postgres column type each polars dtype is staged as.
+POSTGRES_TYPES = {
+    pl.Boolean: 'BOOLEAN',
+    pl.Int8: 'SMALLINT',
+    pl.Int16: 'SMALLINT',
+    pl.Int32: 'INTEGER',
+    pl.Int64: 'BIGINT',
+    pl.UInt8: 'SMALLINT',
+    pl.UInt16: 'INTEGER',
+    pl.UInt32: 'BIGINT',
+    pl.Float32: 'REAL',
+    pl.Float64: 'DOUBLE PRECISION',
+    pl.String: 'TEXT',
+    pl.Date: 'DATE',
+    pl.Datetime: 'TIMESTAMP',
+}
+
+def _postgres_type(dtype: pl.DataType) -> str:
+    if isinstance(dtype, pl.Datetime) and dtype.time_zone is not None:
+        return 'TIMESTAMPTZ'
+
+    postgres_type = POSTGRES_TYPES.get(dtype.base_type())
+
+    if postgres_type is None:
+        raise Exception(f"Unsupported dtype for stage table: {dtype}")
+
+    return postgres_type
+
+@functools.cache
+def _get_pool(pid: int, db_endpoint: str, db_name: str, db_user: str, db_password: str, db_port: str) -> ThreadedConnectionPool:
+    """Connection pool for one database, created once per process.
+
+    Pools are keyed by process id because connections must not be shared with
+    processes forked after the pool was created.
+    """
+    return ThreadedConnectionPool(
+        POOL_MIN_SIZE,
+        POOL_MAX_SIZE,
+        host=db_endpoint,
+        database=db_name,
+        user=db_user,
+        password=db_password,
+        port=db_port,
+        connect_timeout=CONNECT_TIMEOUT,
+    )
+
+@functools.cache
+def _get_engine(pid: int, uri: str):
+    return create_engine(uri, pool_size=POOL_MAX_SIZE, pool_pre_ping=True)
 
 class RDS:
+    """Postgres client backed by a process-wide connection pool.
+
+    Each instance checks a connection out of the pool, checking that it is still alive,
+    and returns it on `close()`, when used as a context manager, or when garbage collected.
+    Connection errors are raised instead of being swallowed.
+
+    Dataframe reads (`execute_to_df`, `iter_batches`) go through a second, ADBC connection
+    when the driver is installed. It is opened once per instance and closed with it, but is
+    a separate session: it does not see the pooled connection's search_path, temporary
+    tables or uncommitted writes, so only read committed, schema-qualified or public tables
+    through it.
+    """
 
     def __init__(self, db_endpoint: str, db_name: str, db_user: str, db_password: str, db_port: str):
         self.db_endpoint = db_endpoint
@@ -13,26 +105,69 @@ class RDS:
         self.db_password = db_password
         self.db_port = db_port
 
+        self.read_connection = None
+        self.pool = _get_pool(os.getpid(), db_endpoint, db_name, db_user, db_password, db_port)
+        self.connection = self._checkout()
+
+        # Create a cursor object
+        self.cursor = self.connection.cursor()
+
+        # SQLAlchemy engine with its own pool, also created once per process
+        self.uri = f'postgresql+psycopg2://{self.db_user}:{self.db_password}@{self.db_endpoint}:{self.db_port}/{self.db_name}'
+        self.engine = _get_engine(os.getpid(), self.uri)
+
+        # Plain libpq URI for the columnar (ADBC) read path
+        self.adbc_uri = f'postgresql://{quote(self.db_user, safe="")}:{quote(self.db_password, safe="")}@{self.db_endpoint}:{self.db_port}/{self.db_name}'
+
+    def _checkout(self):
+        """Check a live connection out of the pool, replacing connections that have gone stale."""
+        for _ in range(POOL_MAX_SIZE + 1):
+            connection = self.pool.getconn()
+
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1;')
+                connection.rollback()
+                return connection
+
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.pool.putconn(connection, close=True)
+
+        raise Exception(f"Unable to get a healthy connection to {self.db_endpoint}/{self.db_name}")
+
+    def close(self) -> None:
+        """Return the connection to the pool, rolling back anything uncommitted."""
+        if self.connection is None:
+            return
+
+        connection, self.connection = self.connection, None
+
+        if self.read_connection is not None and self.read_connection is not connection:
+            self.read_connection.close()
+        self.read_connection = None
+
         try:
-            # Establish the connection
-            self.connection = psycopg2.connect(
-                host=self.db_endpoint,
-                database=self.db_name,
-                user=self.db_user,
-                password=self.db_password,
-                port=self.db_port
-            )
+            self.cursor.close()
+            connection.rollback()
+            self.pool.putconn(connection)
+
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.pool.putconn(connection, close=True)
 
-            # Create a cursor object
-            self.cursor = self.connection.cursor()
+    def __enter__(self) -> 'RDS':
+        return self
 
-            # Create the SQLAlchemy engine
-            self.uri = f'postgresql+psycopg2://{self.db_user}:{self.db_password}@{self.db_endpoint}:{self.db_port}/{self.db_name}'
-            self.engine = create_engine(self.uri)
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        # Tasks usually let the client go out of scope instead of closing it.
+        if getattr(self, 'connection', None) is not None:
+            try:
+                self.close()
+            except Exception:
+                pass
 
-        except Exception as e:
-            print(f'Error: {e}')
-    
     def execute(self, query_string: str) -> list[tuple[any]]:
         
         self.cursor.execute(query_string)
@@ -45,42 +180,319 @@ class RDS:
             self.connection.commit()
             return None
         
-    def execute_sql_file(self, file_name: str) -> list[tuple[any]]:
-
-        with open(file_name, 'r') as file:
-            self.cursor.execute(file.read())
-            
-            if self.cursor.description:  # Means it's a SELECT or returning rows
-                rows = self.cursor.fetchall()
-                return rows
-            
-            else:
-                self.connection.commit()
-                return None
-            
+    def execute_sql_file(self, file_name: str, params: dict = None) -> list[tuple[any]]:
+        self.cursor.execute(catalog.source(file_name), params)
+
+        if self.cursor.description:  # Means it's a SELECT or returning rows
+            rows = self.cursor.fetchall()
+            return rows
+
+        else:
+            self.connection.commit()
+            return None
+
     def execute_sql_template_file(self, file_name: str, params: dict) -> list[tuple[any]]:
-        with open(file_name, 'r') as file:
-            template = jinja2.Template(source=file.read())
-
-            self.cursor.execute(template.render(params))
-            
-            if self.cursor.description:  # Means it's a SELECT or returning rows
-                rows = self.cursor.fetchall()
-                return rows
-            
+        # Identifiers are rendered from the catalog; every other parameter is bound.
+        self.cursor.execute(catalog.render(file_name, params), params)
+
+        if self.cursor.description:  # Means it's a SELECT or returning rows
+            rows = self.cursor.fetchall()
+            return rows
+
+        else:
+            self.connection.commit()
+            return None
+
+    def _execute_prepared(self, file_name: str, params: dict) -> None:
+        """Execute a script without identifiers as a prepared statement.
+
+        The statement is prepared once per pooled connection, so later runs skip
+        parsing and planning and only bind their parameters.
+        """
+        statement_name, prepare, names = catalog.prepared(file_name)
+
+        self.cursor.execute('SELECT 1 FROM pg_prepared_statements WHERE name = %s;', (statement_name,))
+        if self.cursor.fetchone() is None:
+            self.cursor.execute(prepare)
+
+        arguments = ', '.join(['%s'] * len(names))
+        self.cursor.execute(f'EXECUTE "{statement_name}"' + (f' ({arguments})' if names else '') + ';', [params[name] for name in names])
+
+    def execute_merge_template_file(self, file_name: str, params: dict) -> dict[str, int]:
+        """Run a merge or materialize template and commit it.
+
+        The template must end in a SELECT returning the inserted, updated and unchanged
+        row counts, which are logged and returned. Templates without identifiers run as
+        prepared statements.
+        """
+        try:
+            if catalog.is_static(file_name):
+                self._execute_prepared(file_name, params)
             else:
-                self.connection.commit()
-                return None
-            
-    def execute_to_df(self, query_string: str) -> list[tuple[any]]:
-        return pl.read_database(
-            query=query_string,
-            connection=self.connection,
-        ) 
+                self.cursor.execute(catalog.render(file_name, params), params)
+
+            counts = dict(zip([column.name for column in self.cursor.description], self.cursor.fetchone()))
+            self.connection.commit()
+
+        except Exception:
+            self.connection.rollback()
+            raise
+
+        print(f"{os.path.basename(file_name)}: {counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged")
+
+        return counts
+
+    def _read_connection(self):
+        """Connection dataframe reads go through, opened on first use and logged.
+
+        An autocommit ADBC connection, which reads results in columnar form, when the
+        driver and pyarrow are installed. The pooled psycopg2 connection otherwise.
+        """
+        if self.read_connection is None:
+            if adbc is not None:
+                self.read_connection = adbc.connect(self.adbc_uri, autocommit=True)
+                print(f"Reading from {self.db_name} through ADBC.")
+
+            else:
+                self.read_connection = self.connection
+                print(f"Reading from {self.db_name} through psycopg2, install adbc-driver-postgresql[dbapi] for columnar reads.")
+
+        return self.read_connection
+
+    def execute_to_df(self, query_string: str) -> pl.DataFrame:
+        """Run a query and return the result as an Arrow-backed dataframe.
+
+        See `_read_connection` for the connection used.
+        """
+        return pl.read_database(query=query_string, connection=self._read_connection())
+
+    def iter_batches(self, query_string: str, batch_size: int = READ_BATCH_SIZE) -> Iterator[pl.DataFrame]:
+        """Stream a query's result as dataframes of at most `batch_size` rows.
+
+        With ADBC the result arrives as Arrow record batches sized by the driver, which are
+        sliced down to `batch_size`. Without it, rows are read through a psycopg2 server-side
+        cursor, so only one batch is held in memory at a time either way.
+        """
+        connection = self._read_connection()
+
+        if connection is not self.connection:
+            for df in pl.read_database(query=query_string, connection=connection, iter_batches=True, batch_size=batch_size):
+                yield from df.iter_slices(n_rows=batch_size)
+
+            return
+
+        # Named cursors are server-side, so Postgres holds the result until it is fetched.
+        with self.connection.cursor(name=f"rds_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query_string)
+
+            while rows := cursor.fetchmany(batch_size):
+                yield pl.DataFrame(rows, schema=[column.name for column in cursor.description], orient='row', infer_schema_length=None)
+
+        self.connection.commit()
         
-    def stage_dataframe(self, df: pl.DataFrame, table_name: str):
-        df.write_database(
-            table_name=table_name, 
-            connection=self.engine, 
-            if_table_exists='replace', 
-        )
\ No newline at end of file
+    def _create_stage_table(self, schema: pl.Schema, table_name: str, table_type: str = 'TABLE') -> None:
+        columns = ', '.join(f'"{name}" {_postgres_type(dtype)}' for name, dtype in schema.items())
+
+        match table_type:
+
+            case 'TABLE':
+                self.cursor.execute(f'DROP TABLE IF EXISTS "{table_name}";')
+                self.cursor.execute(f'CREATE TABLE "{table_name}" ({columns});')
+
+            case 'UNLOGGED':
+                self.cursor.execute(f'DROP TABLE IF EXISTS "{table_name}";')
+                self.cursor.execute(f'CREATE UNLOGGED TABLE "{table_name}" ({columns});')
+
+            case 'TEMP':
+                self.cursor.execute(f'CREATE TEMP TABLE "{table_name}" ({columns}) ON COMMIT DROP;')
+
+            case _:
+                raise Exception(f"Unsupported stage table type: {table_type}")
+
+    def _copy_dataframe(self, df: pl.DataFrame, table_name: str, batch_size: int = STAGE_BATCH_SIZE) -> None:
+        columns = ', '.join(f'"{name}"' for name in df.columns)
+
+        for batch in df.iter_slices(n_rows=batch_size):
+            buffer = io.BytesIO()
+            batch.write_csv(buffer, include_header=False)
+            buffer.seek(0)
+
+            # Postgres reads unquoted empty fields as NULL and quoted ones as empty strings, matching polars.
+            self.cursor.copy_expert(f'COPY "{table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def _stage(self, data: pl.DataFrame | pl.LazyFrame, table_name: str, table_type: str, batch_size: int = STAGE_BATCH_SIZE) -> None:
+        """Create and fill a stage table without committing."""
+        if isinstance(data, pl.DataFrame):
+            self._create_stage_table(data.schema, table_name, table_type)
+            self._copy_dataframe(data, table_name, batch_size)
+            return
+
+        # Run lazy queries with the streaming engine into a temporary Parquet file and copy it in batches.
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f"{table_name}.parquet")
+            data.sink_parquet(path)
+
+            self._create_stage_table(pl.read_parquet_schema(path), table_name, table_type)
+
+            row_count = pl.scan_parquet(path).select(pl.len()).collect().item()
+
+            for offset in range(0, row_count, batch_size):
+                self._copy_dataframe(pl.scan_parquet(path).slice(offset, batch_size).collect(), table_name, batch_size)
+
+    def stage_dataframe(self, df: pl.DataFrame, table_name: str, table_type: str = 'TABLE'):
+        """Replace the stage table with the dataframe, bulk loaded through COPY FROM STDIN.
+
+        The table is created from the dataframe's schema and filled `STAGE_BATCH_SIZE`
+        rows at a time, so only one batch is serialized to CSV at once.
+
+        Args:
+            df (pl.DataFrame): Data to stage.
+            table_name (str): Stage table name.
+            table_type (str): `TABLE` or `UNLOGGED`. Use `stage_and_merge` for temporary tables.
+        """
+        self._stage(df, table_name, table_type)
+        self.connection.commit()
+
+    def stage_lazyframe(self, lf: pl.LazyFrame, table_name: str, batch_size: int = STAGE_BATCH_SIZE, table_type: str = 'TABLE'):
+        """Stage a lazy query without materializing it in memory.
+
+        The query is run with the streaming engine into a temporary Parquet file,
+        which is then copied into the stage table `batch_size` rows at a time.
+        """
+        self._stage(lf, table_name, table_type, batch_size)
+        self.connection.commit()
+
+    def _is_partitioned(self, table: str) -> bool:
+        self.cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s));', (table,))
+        return self.cursor.fetchone()[0]
+
+    def _ensure_month_partitions(self, table: str, from_date: dt.date, to_date: dt.date) -> None:
+        month = from_date.replace(day=1)
+
+        while month <= to_date:
+            next_month = (month.replace(day=28) + dt.timedelta(days=4)).replace(day=1)
+
+            self.cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}_{month:%Y_%m}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s);',
+                (month, next_month),
+            )
+
+            month = next_month
+
+    def ensure_month_partitions(self, table: str, from_date: dt.date, to_date: dt.date) -> None:
+        """Create any missing monthly partitions of a table between from_date and to_date.
+
+        Partitions are named `{table}_YYYY_MM`. Tables that are not partitioned are left alone.
+        """
+        if self._is_partitioned(table):
+            self._ensure_month_partitions(table, from_date, to_date)
+
+        self.connection.commit()
+
+    def create_partitioned_table(self, create_file: str, table: str, date_column: str) -> None:
+        """Run a table's create script, migrating an existing unpartitioned table into it.
+
+        Tables created before monthly partitioning are renamed, recreated from
+        `create_file`, and copied into their monthly partitions in one transaction.
+        The copy holds an ACCESS EXCLUSIVE lock on the table, so run it ahead of time
+        with the partition_migration DAG. Concurrent first runs are serialized on an
+        advisory lock, and only the first one migrates.
+
+        Args:
+            create_file (str): SQL file creating the table with `PARTITION BY RANGE (date_column)`.
+            table (str): Table name.
+            date_column (str): Column the table is partitioned on.
+        """
+        self.cursor.execute('SELECT to_regclass(%s) IS NOT NULL;', (table,))
+        exists = self.cursor.fetchone()[0]
+
+        if exists and self._is_partitioned(table):
+            # The script is idempotent, so indexes added to it since are created.
+            self.cursor.execute(catalog.source(create_file))
+            self.connection.commit()
+            return
+
+        legacy_table = f"{table}_unpartitioned"
+
+        try:
+            # Another task may have migrated the table while this one waited for the lock.
+            self.cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s));', (f"create_partitioned_table:{table}",))
+            self.cursor.execute('SELECT to_regclass(%s) IS NOT NULL;', (table,))
+            exists = self.cursor.fetchone()[0]
+
+            if exists and self._is_partitioned(table):
+                self.cursor.execute(catalog.source(create_file))
+                self.connection.commit()
+                return
+
+            if exists:
+                self.cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy_table}";')
+                self.cursor.execute(f'ALTER TABLE "{legacy_table}" RENAME CONSTRAINT "{table}_pkey" TO "{legacy_table}_pkey";')
+
+            self.cursor.execute(catalog.source(create_file))
+
+            if exists:
+                self.cursor.execute(f'SELECT MIN("{date_column}"), MAX("{date_column}") FROM "{legacy_table}";')
+                from_date, to_date = self.cursor.fetchone()
+
+                if from_date is not None:
+                    self._ensure_month_partitions(table, from_date, to_date)
+                    self.cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy_table}";')
+
+                self.cursor.execute(f'DROP TABLE "{legacy_table}";')
+                print(f"Migrated {table} to monthly partitions")
+
+            self.connection.commit()
+
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    def stage_and_merge(self, data: pl.DataFrame | pl.LazyFrame, stage_table: str, merge_file: str, params: dict = None, table_type: str = 'TEMP', partition_by: tuple[str, str] = None) -> dict[str, int]:
+        """Stage data and merge it into its core table in a single transaction.
+
+        By default the stage table is a TEMP table dropped on commit, so staging writes
+        no WAL and leaves nothing in the catalog. If any step fails the transaction is
+        rolled back, leaving neither a stage table nor a partial merge behind.
+
+        Args:
+            data (pl.DataFrame | pl.LazyFrame): Data to stage. Lazy queries are streamed.
+            stage_table (str): Stage table name, passed to the merge template as `stage_table`.
+            merge_file (str): Jinja SQL template merging the stage table into its core table.
+            params (dict): Extra template parameters.
+            table_type (str): `TEMP`, `UNLOGGED` or `TABLE`.
+            partition_by (tuple[str, str]): Core table and date column it is partitioned on by month.
+                Partitions covering the staged dates are created before merging.
+
+        Returns:
+            dict[str, int]: Number of rows inserted, updated and left unchanged by the merge.
+        """
+        params = {'stage_table': stage_table, **(params or {})}
+
+        try:
+            self._stage(data, stage_table, table_type)
+
+            if partition_by is not None:
+                table, date_column = partition_by
+                self.cursor.execute(f'SELECT MIN("{date_column}"), MAX("{date_column}") FROM "{stage_table}";')
+                from_date, to_date = self.cursor.fetchone()
+
+                if from_date is not None and self._is_partitioned(table):
+                    self._ensure_month_partitions(table, from_date, to_date)
+
+            self.cursor.execute(catalog.render(merge_file, params), params)
+            counts = dict(zip([column.name for column in self.cursor.description], self.cursor.fetchone()))
+
+            if table_type != 'TEMP':
+                self.cursor.execute(f'DROP TABLE "{stage_table}";')
+
+            self.connection.commit()
+
+        except Exception:
+            self.connection.rollback()
+            raise
+
+        print(f"{stage_table}: {counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged")
+
+        return counts
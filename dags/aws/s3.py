@@ -1,6 +1,7 @@
 import boto3
 import polars as pl
 from io import StringIO, BytesIO
+from typing import IO
 
 class S3:
 
@@ -19,14 +20,30 @@ class S3:
 
         return pl.read_csv(StringIO(file_content))
     
-    def drop_file(self, file_name: str, bucket_name: str, file_data: pl.DataFrame) -> None:
-        csv_buffer = StringIO()
+    def drop_file(self, file_name: str, bucket_name: str, file_data: pl.DataFrame, file_format: str = 'csv') -> None:
+        match file_format:
 
-        file_data.write_csv(csv_buffer)
+            case 'csv':
+                csv_buffer = StringIO()
 
-        csv_bytes = BytesIO(csv_buffer.getvalue().encode())
+                file_data.write_csv(csv_buffer)
 
-        self.client.upload_fileobj(csv_bytes, bucket_name, file_name)
+                file_bytes = BytesIO(csv_buffer.getvalue().encode())
+
+            case 'parquet':
+                file_bytes = BytesIO()
+
+                file_data.write_parquet(file_bytes, compression='zstd')
+
+                file_bytes.seek(0)
+
+            case _:
+                raise Exception(f"Unsupported file format: {file_format}")
+
+        self.client.upload_fileobj(file_bytes, bucket_name, file_name)
+
+    def upload_file_object(self, file_name: str, bucket_name: str, file_object: IO[bytes]) -> None:
+        self.client.upload_fileobj(file_object, bucket_name, file_name)
 
     def list_files(self, bucket_name: str):
         file_paths = []
@@ -0,0 +1,88 @@
+import functools
+import os
+import re
+import jinja2
+import jinja2.meta
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql')
+
+# psycopg2 named placeholder, e.g. %(start_date)s
+PLACEHOLDER = re.compile(r'%\((\w+)\)s')
+
+class SQLCatalog:
+    """Every SQL script in a directory, read and compiled once per process.
+
+    Scripts are looked up by file name, so the paths tasks already pass
+    (e.g. `dags/sql/positions_merge.sql`) keep working. Jinja is only used for
+    identifiers such as `{{stage_table}}`, which cannot be bound. Values such as
+    dates are written as psycopg2 `%(name)s` placeholders and bound at execution,
+    so the statement text stays the same from one call to the next.
+
+    Args:
+        directory (str): Directory holding the `.sql` files.
+    """
+
+    def __init__(self, directory: str = SQL_DIR) -> None:
+        self.sources: dict[str, str] = {}
+        self.templates: dict[str, jinja2.Template] = {}
+        self.identifiers: dict[str, set[str]] = {}
+
+        environment = jinja2.Environment()
+
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.sql'):
+                continue
+
+            with open(os.path.join(directory, file_name), 'r') as file:
+                source = file.read()
+
+            self.sources[file_name] = source
+            self.templates[file_name] = environment.from_string(source)
+            self.identifiers[file_name] = jinja2.meta.find_undeclared_variables(environment.parse(source))
+
+    def _key(self, file_name: str) -> str:
+        key = os.path.basename(file_name)
+
+        if key not in self.sources:
+            raise Exception(f"SQL script not found in catalog: {file_name}")
+
+        return key
+
+    def source(self, file_name: str) -> str:
+        return self.sources[self._key(file_name)]
+
+    def is_static(self, file_name: str) -> bool:
+        """Whether the script has no Jinja identifiers, so its text never changes."""
+        return not self.identifiers[self._key(file_name)]
+
+    def render(self, file_name: str, params: dict = None) -> str:
+        """Render the script's identifiers. Bind parameters are left as placeholders."""
+        key = self._key(file_name)
+        identifiers = {name: value for name, value in (params or {}).items() if name in self.identifiers[key]}
+
+        return self._render(key, tuple(sorted(identifiers.items())))
+
+    @functools.lru_cache(maxsize=256)
+    def _render(self, key: str, identifiers: tuple) -> str:
+        return self.templates[key].render(dict(identifiers))
+
+    @functools.lru_cache(maxsize=None)
+    def prepared(self, file_name: str) -> tuple[str, str, list[str]]:
+        """Statement name, PREPARE statement and ordered parameter names of a static script.
+
+        Placeholders are rewritten to positional `$n` parameters, so Postgres can plan
+        the statement once per connection and reuse the plan on every EXECUTE.
+        """
+        key = self._key(file_name)
+
+        if not self.is_static(key):
+            raise Exception(f"Only scripts without identifiers can be prepared: {file_name}")
+
+        names = list(dict.fromkeys(PLACEHOLDER.findall(self.sources[key])))
+        body = PLACEHOLDER.sub(lambda match: f"${names.index(match.group(1)) + 1}", self.sources[key]).strip().rstrip(';')
+        statement_name = key.removesuffix('.sql')
+
+        return statement_name, f'PREPARE "{statement_name}" AS\n{body}', names
+
+
+catalog = SQLCatalog()
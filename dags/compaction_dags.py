@@ -0,0 +1,11 @@
+from airflow.sdk import dag
+from tasks.compaction_tasks import compaction
+
+
+# Runs early on the 2nd so the previous month's last daily extract has landed.
+@dag(schedule="0 4 2 * *", max_active_tasks=1)
+def landing_compaction_dag():
+    compaction()
+
+
+landing_compaction_dag()
@@ -46,4 +46,10 @@ configs = [
     },
 ]
 
-min_date = dt.date(2020, 1, 1)
\ No newline at end of file
+min_date = dt.date(2020, 1, 1)
+
+# Keep a byte-for-byte copy of every raw IBKR statement under raw-files/ in S3.
+archive_raw_files = True
+# Engine reload tasks compute returns with: 'sql' runs the *_materialize.sql scripts in the
+# database, 'polars' computes them on the worker with tools.returns and bulk loads the results.
+return_engine = 'sql'
@@ -0,0 +1,12 @@
+from airflow.sdk import dag
+from tasks.migration_tasks import partition_migration
+
+
+# Triggered by hand, outside the daily run, so copying existing tables into
+# their monthly partitions never blocks the ETL tasks.
+@dag(schedule=None, max_active_tasks=1)
+def partition_migration_dag():
+    partition_migration()
+
+
+partition_migration_dag()
@@ -1,10 +1,6 @@
-INSERT INTO all_fund_returns (
-    date,
-    value,
-    return,
-    dividends
-)
-WITH filter AS(
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH window_rows AS(
     SELECT
         d.date,
         client_account_id,
@@ -13,6 +9,36 @@ WITH filter AS(
         dividends
     FROM delta_nav_new d
     INNER JOIN calendar_new c ON d.date = c.date
+    WHERE d.date BETWEEN %(start_date)s AND %(end_date)s
+),
+-- Each account's last market date row before the window, so its first day is lagged
+-- against it like LAG over the account's whole history would, even across gaps.
+seed AS(
+    SELECT
+        s.date,
+        k.client_account_id,
+        s.ending_value,
+        s.deposits_withdrawals,
+        s.dividends
+    FROM (SELECT DISTINCT client_account_id FROM window_rows) k
+    CROSS JOIN LATERAL (
+        SELECT
+            d.date,
+            d.ending_value,
+            d.deposits_withdrawals,
+            d.dividends
+        FROM delta_nav_new d
+        INNER JOIN calendar_new c ON d.date = c.date
+        WHERE d.client_account_id = k.client_account_id
+            AND d.date < %(start_date)s
+        ORDER BY d.date DESC
+        LIMIT 1
+    ) s
+),
+filter AS(
+    SELECT * FROM window_rows
+    UNION ALL
+    SELECT * FROM seed
 ),
 transform AS(
     SELECT
@@ -33,17 +59,49 @@ values AS(
         SUM(dividends) AS dividends
     FROM transform
     GROUP BY date
+),
+-- Rounded to the scales tools.returns rounds to, so both engines write identical values.
+source AS (
+    SELECT
+        date,
+        ROUND(ending_value - deposits_withdrawals, 6) AS value,
+        ROUND((ending_value - deposits_withdrawals) / starting_value - 1, 12) AS return,
+        ROUND(dividends, 6) AS dividends
+    FROM values
+    WHERE date BETWEEN %(start_date)s AND %(end_date)s
+),
+merged AS (
+    INSERT INTO all_fund_returns (
+        date,
+        value,
+        return,
+        dividends
+    )
+    SELECT
+        date,
+        value,
+        return,
+        dividends
+    FROM source
+    ON CONFLICT (date)
+    DO UPDATE SET
+        value = EXCLUDED.value,
+        return = EXCLUDED.return,
+        dividends = EXCLUDED.dividends
+    WHERE (
+        all_fund_returns.value,
+        all_fund_returns.return,
+        all_fund_returns.dividends
+    ) IS DISTINCT FROM (
+        EXCLUDED.value,
+        EXCLUDED.return,
+        EXCLUDED.dividends
+    )
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    date,
-    ending_value - deposits_withdrawals AS value,
-    (ending_value - deposits_withdrawals) / starting_value - 1 AS return,
-    dividends
-FROM values
-WHERE date BETWEEN '{{start_date}}' AND '{{end_date}}'
-ON CONFLICT (date)
-DO UPDATE SET
-    value = EXCLUDED.value,
-    return = EXCLUDED.return,
-    dividends = EXCLUDED.dividends
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM source) - COUNT(*) AS unchanged
+FROM merged
 ;
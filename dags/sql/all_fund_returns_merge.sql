@@ -0,0 +1,41 @@
+-- Loads all_fund_returns computed outside the database (see tools.returns).
+-- Staged values are doubles, so they are rounded back to the scales the
+-- materialize script writes, and reloads through either engine compare equal.
+--
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO all_fund_returns (
+        date,
+        value,
+        return,
+        dividends
+    )
+    SELECT
+        date,
+        ROUND(value::NUMERIC, 6),
+        ROUND(return::NUMERIC, 12),
+        ROUND(dividends::NUMERIC, 6)
+    FROM "{{stage_table}}"
+    ON CONFLICT (date)
+    DO UPDATE SET
+        value = EXCLUDED.value,
+        return = EXCLUDED.return,
+        dividends = EXCLUDED.dividends
+    WHERE (
+        all_fund_returns.value,
+        all_fund_returns.return,
+        all_fund_returns.dividends
+    ) IS DISTINCT FROM (
+        EXCLUDED.value,
+        EXCLUDED.return,
+        EXCLUDED.dividends
+    )
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
+;
@@ -0,0 +1,10 @@
+-- Month shards of an all fund returns reload. All fund returns sum over every
+-- account, so each shard covers all of them ('*').
+SELECT
+    '*' AS client_account_id,
+    DATE_TRUNC('month', date)::DATE AS month
+FROM delta_nav_new
+WHERE date BETWEEN %(start_date)s AND %(end_date)s
+GROUP BY DATE_TRUNC('month', date)
+ORDER BY month
+;
@@ -1,22 +1,39 @@
-INSERT INTO benchmark_new (
-    date,
-    ticker,
-    adjusted_close,
-    return,
-    dividends_per_share
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO benchmark_new (
+        date,
+        ticker,
+        adjusted_close,
+        return,
+        dividends_per_share
+    )
+    SELECT
+        date,
+        ticker,
+        adjusted_close,
+        return,
+        dividends_per_share
+    FROM "{{stage_table}}"
+    ON CONFLICT (date, ticker)
+    DO UPDATE SET
+        adjusted_close = EXCLUDED.adjusted_close,
+        return = EXCLUDED.return,
+        dividends_per_share = EXCLUDED.dividends_per_share
+    WHERE (
+        benchmark_new.adjusted_close,
+        benchmark_new.return,
+        benchmark_new.dividends_per_share
+    ) IS DISTINCT FROM (
+        EXCLUDED.adjusted_close,
+        EXCLUDED.return,
+        EXCLUDED.dividends_per_share
+    )
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    date,
-    ticker,
-    adjusted_close,
-    return,
-    dividends_per_share
-FROM "{{stage_table}}"
-ON CONFLICT (date, ticker)
-DO UPDATE SET 
-    date = EXCLUDED.date,
-    ticker = EXCLUDED.ticker,
-    adjusted_close = EXCLUDED.adjusted_close,
-    return = EXCLUDED.return,
-    dividends_per_share = EXCLUDED.dividends_per_share
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
 ;
@@ -1,9 +1,19 @@
-INSERT INTO calendar_new (
-    date
+-- Existing rows are left untouched, and the counts of inserted, updated and
+-- unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO calendar_new (
+        date
+    )
+    SELECT
+        date
+    FROM "{{stage_table}}"
+    ON CONFLICT (date)
+    DO NOTHING
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    date
-FROM "{{stage_table}}"
-ON CONFLICT (date)
-DO NOTHING
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
 ;
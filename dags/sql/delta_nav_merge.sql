@@ -1,23 +1,44 @@
-INSERT INTO delta_nav_new (
-    date,
-    client_account_id,
-    starting_value,
-    ending_value,
-    deposits_withdrawals,
-    dividends
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO delta_nav_new (
+        date,
+        client_account_id,
+        starting_value,
+        ending_value,
+        deposits_withdrawals,
+        dividends
+    )
+    SELECT
+        date,
+        client_account_id,
+        starting_value,
+        ending_value,
+        deposits_withdrawals,
+        dividends
+    FROM "{{stage_table}}"
+    ON CONFLICT (date, client_account_id)
+    DO UPDATE SET
+        starting_value = EXCLUDED.starting_value,
+        ending_value = EXCLUDED.ending_value,
+        deposits_withdrawals = EXCLUDED.deposits_withdrawals,
+        dividends = EXCLUDED.dividends
+    WHERE (
+        delta_nav_new.starting_value,
+        delta_nav_new.ending_value,
+        delta_nav_new.deposits_withdrawals,
+        delta_nav_new.dividends
+    ) IS DISTINCT FROM (
+        EXCLUDED.starting_value,
+        EXCLUDED.ending_value,
+        EXCLUDED.deposits_withdrawals,
+        EXCLUDED.dividends
+    )
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    date,
-    client_account_id,
-    starting_value,
-    ending_value,
-    deposits_withdrawals,
-    dividends
-FROM "{{stage_table}}"
-ON CONFLICT (date, client_account_id)
-DO UPDATE SET
-    starting_value = EXCLUDED.starting_value,
-    ending_value = EXCLUDED.ending_value,
-    deposits_withdrawals = EXCLUDED.deposits_withdrawals,
-    dividends = EXCLUDED.dividends
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
 ;
@@ -1,3 +1,4 @@
+-- Range partitioned by month. Partitions are created by RDS.ensure_month_partitions.
 CREATE TABLE IF NOT EXISTS dividends_new (
     report_date DATE,
     client_account_id TEXT,
@@ -17,5 +18,5 @@ CREATE TABLE IF NOT EXISTS dividends_new (
     fee NUMERIC,
     net_amount NUMERIC,
     PRIMARY KEY (report_date, client_account_id, symbol, action_id)
-)
+) PARTITION BY RANGE (report_date)
 ;
@@ -1,54 +1,93 @@
-INSERT INTO dividends_new (
-    report_date,
-    client_account_id,
-    asset_class,
-    sub_category,
-    description,
-    cusip,
-    isin,
-    symbol,
-    action_id,
-    ex_date,
-    pay_date,
-    quantity,
-    gross_rate,
-    gross_amount,
-    tax,
-    fee,
-    net_amount
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO dividends_new (
+        report_date,
+        client_account_id,
+        asset_class,
+        sub_category,
+        description,
+        cusip,
+        isin,
+        symbol,
+        action_id,
+        ex_date,
+        pay_date,
+        quantity,
+        gross_rate,
+        gross_amount,
+        tax,
+        fee,
+        net_amount
+    )
+    SELECT
+        report_date,
+        client_account_id,
+        asset_class,
+        sub_category,
+        description,
+        cusip,
+        isin,
+        symbol,
+        action_id,
+        ex_date,
+        pay_date,
+        quantity,
+        gross_rate,
+        gross_amount,
+        tax,
+        fee,
+        net_amount
+    FROM "{{stage_table}}"
+    ON CONFLICT (report_date, client_account_id, symbol, action_id)
+    DO UPDATE SET
+        asset_class = EXCLUDED.asset_class,
+        sub_category = EXCLUDED.sub_category,
+        description = EXCLUDED.description,
+        cusip = EXCLUDED.cusip,
+        isin = EXCLUDED.isin,
+        ex_date = EXCLUDED.ex_date,
+        pay_date = EXCLUDED.pay_date,
+        quantity = EXCLUDED.quantity,
+        gross_rate = EXCLUDED.gross_rate,
+        gross_amount = EXCLUDED.gross_amount,
+        tax = EXCLUDED.tax,
+        fee = EXCLUDED.fee,
+        net_amount = EXCLUDED.net_amount
+    WHERE (
+        dividends_new.asset_class,
+        dividends_new.sub_category,
+        dividends_new.description,
+        dividends_new.cusip,
+        dividends_new.isin,
+        dividends_new.ex_date,
+        dividends_new.pay_date,
+        dividends_new.quantity,
+        dividends_new.gross_rate,
+        dividends_new.gross_amount,
+        dividends_new.tax,
+        dividends_new.fee,
+        dividends_new.net_amount
+    ) IS DISTINCT FROM (
+        EXCLUDED.asset_class,
+        EXCLUDED.sub_category,
+        EXCLUDED.description,
+        EXCLUDED.cusip,
+        EXCLUDED.isin,
+        EXCLUDED.ex_date,
+        EXCLUDED.pay_date,
+        EXCLUDED.quantity,
+        EXCLUDED.gross_rate,
+        EXCLUDED.gross_amount,
+        EXCLUDED.tax,
+        EXCLUDED.fee,
+        EXCLUDED.net_amount
+    )
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    report_date,
-    client_account_id,
-    asset_class,
-    sub_category,
-    description,
-    cusip,
-    isin,
-    symbol,
-    action_id,
-    ex_date,
-    pay_date,
-    quantity,
-    gross_rate,
-    gross_amount,
-    tax,
-    fee,
-    net_amount
-FROM "{{stage_table}}"
-ON CONFLICT (report_date, client_account_id, symbol, action_id)
-DO UPDATE SET
-    asset_class = EXCLUDED.asset_class,
-    sub_category = EXCLUDED.sub_category,
-    description = EXCLUDED.description,
-    cusip = EXCLUDED.cusip,
-    isin = EXCLUDED.isin,
-    ex_date = EXCLUDED.ex_date,
-    pay_date = EXCLUDED.pay_date,
-    quantity = EXCLUDED.quantity,
-    gross_rate = EXCLUDED.gross_rate,
-    gross_amount = EXCLUDED.gross_amount,
-    tax = EXCLUDED.tax,
-    fee = EXCLUDED.fee,
-    net_amount = EXCLUDED.net_amount
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
 ;
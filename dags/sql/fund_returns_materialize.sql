@@ -1,11 +1,8 @@
-INSERT INTO fund_returns (
-    date,
-    client_account_id,
-    value,
-    return,
-    dividends
-)
-WITH filter AS(
+-- accounts limits the run to some accounts (all if NULL).
+--
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH window_rows AS(
     SELECT
         d.date,
         client_account_id,
@@ -14,6 +11,37 @@ WITH filter AS(
         dividends
     FROM delta_nav_new d
     INNER JOIN calendar_new c ON d.date = c.date
+    WHERE d.date BETWEEN %(start_date)s AND %(end_date)s
+        AND (%(accounts)s::TEXT[] IS NULL OR d.client_account_id = ANY(%(accounts)s::TEXT[]))
+),
+-- Each account's last market date row before the window, so its first day is lagged
+-- against it like LAG over the account's whole history would, even across gaps.
+seed AS(
+    SELECT
+        s.date,
+        k.client_account_id,
+        s.ending_value,
+        s.deposits_withdrawals,
+        s.dividends
+    FROM (SELECT DISTINCT client_account_id FROM window_rows) k
+    CROSS JOIN LATERAL (
+        SELECT
+            d.date,
+            d.ending_value,
+            d.deposits_withdrawals,
+            d.dividends
+        FROM delta_nav_new d
+        INNER JOIN calendar_new c ON d.date = c.date
+        WHERE d.client_account_id = k.client_account_id
+            AND d.date < %(start_date)s
+        ORDER BY d.date DESC
+        LIMIT 1
+    ) s
+),
+filter AS(
+    SELECT * FROM window_rows
+    UNION ALL
+    SELECT * FROM seed
 ),
 transform AS(
     SELECT
@@ -24,18 +52,52 @@ transform AS(
         deposits_withdrawals,
         dividends
     FROM filter
+),
+-- Rounded to the scales tools.returns rounds to, so both engines write identical values.
+source AS (
+    SELECT
+        date,
+        client_account_id,
+        ROUND(ending_value - deposits_withdrawals, 6) AS value,
+        ROUND((ending_value - deposits_withdrawals) / starting_value - 1, 12) AS return,
+        ROUND(dividends, 6) AS dividends
+    FROM transform
+    WHERE date BETWEEN %(start_date)s AND %(end_date)s
+),
+merged AS (
+    INSERT INTO fund_returns (
+        date,
+        client_account_id,
+        value,
+        return,
+        dividends
+    )
+    SELECT
+        date,
+        client_account_id,
+        value,
+        return,
+        dividends
+    FROM source
+    ON CONFLICT (date, client_account_id)
+    DO UPDATE SET
+        value = EXCLUDED.value,
+        return = EXCLUDED.return,
+        dividends = EXCLUDED.dividends
+    WHERE (
+        fund_returns.value,
+        fund_returns.return,
+        fund_returns.dividends
+    ) IS DISTINCT FROM (
+        EXCLUDED.value,
+        EXCLUDED.return,
+        EXCLUDED.dividends
+    )
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    date,
-    client_account_id,
-    ending_value - deposits_withdrawals AS value,
-    (ending_value - deposits_withdrawals) / starting_value - 1 AS return,
-    dividends
-FROM transform
-WHERE date BETWEEN '{{start_date}}' AND '{{end_date}}'
-ON CONFLICT (date, client_account_id)
-DO UPDATE SET
-    value = EXCLUDED.value,
-    return = EXCLUDED.return,
-    dividends = EXCLUDED.dividends
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM source) - COUNT(*) AS unchanged
+FROM merged
 ;
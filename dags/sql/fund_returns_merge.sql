@@ -0,0 +1,43 @@
+-- Loads fund_returns computed outside the database (see tools.returns).
+-- Staged values are doubles, so they are rounded back to the scales the
+-- materialize script writes, and reloads through either engine compare equal.
+--
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO fund_returns (
+        date,
+        client_account_id,
+        value,
+        return,
+        dividends
+    )
+    SELECT
+        date,
+        client_account_id,
+        ROUND(value::NUMERIC, 6),
+        ROUND(return::NUMERIC, 12),
+        ROUND(dividends::NUMERIC, 6)
+    FROM "{{stage_table}}"
+    ON CONFLICT (date, client_account_id)
+    DO UPDATE SET
+        value = EXCLUDED.value,
+        return = EXCLUDED.return,
+        dividends = EXCLUDED.dividends
+    WHERE (
+        fund_returns.value,
+        fund_returns.return,
+        fund_returns.dividends
+    ) IS DISTINCT FROM (
+        EXCLUDED.value,
+        EXCLUDED.return,
+        EXCLUDED.dividends
+    )
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
+;
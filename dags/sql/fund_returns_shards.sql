@@ -0,0 +1,10 @@
+-- (account, month) shards of a fund returns reload: every month an account has
+-- delta NAV in.
+SELECT
+    client_account_id,
+    DATE_TRUNC('month', date)::DATE AS month
+FROM delta_nav_new
+WHERE date BETWEEN %(start_date)s AND %(end_date)s
+GROUP BY client_account_id, DATE_TRUNC('month', date)
+ORDER BY month, client_account_id
+;
@@ -1,3 +1,4 @@
+-- Range partitioned by month. Partitions are created by RDS.ensure_month_partitions.
 CREATE TABLE IF NOT EXISTS holding_returns (
     date DATE,
     client_account_id TEXT,
@@ -12,5 +13,5 @@ CREATE TABLE IF NOT EXISTS holding_returns (
     dividends NUMERIC,
     dividends_per_share NUMERIC,
     PRIMARY KEY (date, client_account_id, ticker)
-)
+) PARTITION BY RANGE (date)
 ;
@@ -1,17 +1,17 @@
-INSERT INTO holding_returns (
-    date,
-    client_account_id,
-    ticker,
-    weight,
-    shares,
-    price,
-    value,
-    shares_traded,
-    average_trade_price,
-    return,
-    dividends,
-    dividends_per_share
-)
+-- Materializes holding returns for start_date..end_date only. The prior day of
+-- each (account, symbol) comes from holding_state, the last row seen before the
+-- window, so a daily run reads a single day of positions, trades and dividends.
+-- Keys without usable state (new holdings, a rerun of a window older than the
+-- state, or source rows landed between the state and the window) fall back to
+-- their last row in the source tables. The last row of each key in the window
+-- is carried forward into holding_state.
+--
+-- accounts limits the run to some accounts (all if NULL). Runs that may overlap
+-- others, like the shards of a reload, set carry_state to false: they neither read
+-- nor write holding_state and seed every key from the source tables instead.
+--
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
 WITH positions AS (
     SELECT
         client_account_id,
@@ -23,7 +23,8 @@ WITH positions AS (
         CASE WHEN quantity > 0 THEN 1 ELSE -1 END AS side
     FROM positions_new
     WHERE sub_category IN ('ETF', 'COMMON', 'ADR')
-        AND report_date BETWEEN '{{start_date}}' AND '{{end_date}}'
+        AND report_date BETWEEN %(start_date)s AND %(end_date)s
+        AND (%(accounts)s::TEXT[] IS NULL OR client_account_id = ANY(%(accounts)s::TEXT[]))
 ),
 dividends AS(
     SELECT
@@ -34,7 +35,8 @@ dividends AS(
         SUM(gross_rate) AS dividends_per_share
     FROM dividends_new
     WHERE sub_category IN ('ETF', 'COMMON', 'ADR')
-        AND report_date BETWEEN '{{start_date}}' AND '{{end_date}}'
+        AND report_date BETWEEN %(start_date)s AND %(end_date)s
+        AND (%(accounts)s::TEXT[] IS NULL OR client_account_id = ANY(%(accounts)s::TEXT[]))
     GROUP BY client_account_id, symbol, report_date
 ),
 trades AS(
@@ -46,7 +48,8 @@ trades AS(
         SUM(quantity * trade_price) / SUM(quantity) AS average_trade_price
     FROM trades_new
     WHERE sub_category IN ('ETF', 'COMMON', 'ATR')
-        AND report_date BETWEEN '{{start_date}}' AND '{{end_date}}'
+        AND report_date BETWEEN %(start_date)s AND %(end_date)s
+        AND (%(accounts)s::TEXT[] IS NULL OR client_account_id = ANY(%(accounts)s::TEXT[]))
     GROUP BY client_account_id, symbol, report_date
     HAVING SUM(quantity) != 0
 ),
@@ -78,6 +81,151 @@ merge AS(
         AND base.report_date = t.report_date
         AND base.symbol = t.symbol
 ),
+window_keys AS (
+    SELECT DISTINCT client_account_id, symbol FROM merge
+),
+state AS (
+    SELECT
+        s.client_account_id,
+        s.report_date,
+        s.symbol,
+        s.fx_rate AS fx_rate_1,
+        s.shares AS shares_1,
+        s.price AS price_1
+    FROM holding_state s
+    INNER JOIN window_keys k ON s.client_account_id = k.client_account_id
+        AND s.symbol = k.symbol
+    WHERE %(carry_state)s
+        AND s.report_date < %(start_date)s
+        -- The state is only the prior row if no source row falls between it and the window.
+        AND NOT EXISTS (
+            SELECT 1
+            FROM positions_new p
+            WHERE p.client_account_id = s.client_account_id
+                AND p.symbol = s.symbol
+                AND p.sub_category IN ('ETF', 'COMMON', 'ADR')
+                AND p.report_date > s.report_date
+                AND p.report_date < %(start_date)s
+        )
+        AND NOT EXISTS (
+            SELECT 1
+            FROM trades_new t
+            WHERE t.client_account_id = s.client_account_id
+                AND t.symbol = s.symbol
+                AND t.sub_category IN ('ETF', 'COMMON', 'ATR')
+                AND t.report_date > s.report_date
+                AND t.report_date < %(start_date)s
+        )
+),
+history AS (
+    SELECT
+        k.client_account_id,
+        h.report_date,
+        k.symbol,
+        p.fx_rate_to_base AS fx_rate_1,
+        p.quantity AS shares_1,
+        p.mark_price AS price_1
+    FROM window_keys k
+    -- Each lookup is a backward scan of the (client_account_id, symbol, report_date)
+    -- indexes that stops at the key's last row before the window.
+    CROSS JOIN LATERAL (
+        SELECT GREATEST(
+            (
+                SELECT MAX(report_date)
+                FROM positions_new
+                WHERE client_account_id = k.client_account_id
+                    AND symbol = k.symbol
+                    AND sub_category IN ('ETF', 'COMMON', 'ADR')
+                    AND report_date < %(start_date)s
+            ),
+            (
+                SELECT report_date
+                FROM trades_new
+                WHERE client_account_id = k.client_account_id
+                    AND symbol = k.symbol
+                    AND sub_category IN ('ETF', 'COMMON', 'ATR')
+                    AND report_date < %(start_date)s
+                GROUP BY report_date
+                HAVING SUM(quantity) != 0
+                ORDER BY report_date DESC
+                LIMIT 1
+            )
+        ) AS report_date
+    ) h
+    LEFT JOIN positions_new p ON p.client_account_id = k.client_account_id
+        AND p.report_date = h.report_date
+        AND p.symbol = k.symbol
+        AND p.sub_category IN ('ETF', 'COMMON', 'ADR')
+    WHERE h.report_date IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM state s
+            WHERE s.client_account_id = k.client_account_id
+                AND s.symbol = k.symbol
+        )
+),
+seeded AS (
+    SELECT
+        client_account_id,
+        report_date,
+        symbol,
+        side,
+        fx_rate_1,
+        shares_1,
+        price_1,
+        dividends,
+        dividends_per_share,
+        shares_traded,
+        average_trade_price,
+        FALSE AS is_seed
+    FROM merge
+    UNION ALL
+    SELECT
+        client_account_id,
+        report_date,
+        symbol,
+        NULL,
+        fx_rate_1,
+        shares_1,
+        price_1,
+        NULL,
+        NULL,
+        NULL,
+        NULL,
+        TRUE AS is_seed
+    FROM (
+        SELECT * FROM state
+        UNION ALL
+        SELECT * FROM history
+    ) seeds
+),
+carried AS (
+    INSERT INTO holding_state (
+        client_account_id,
+        symbol,
+        report_date,
+        shares,
+        price,
+        fx_rate
+    )
+    SELECT DISTINCT ON (client_account_id, symbol)
+        client_account_id,
+        symbol,
+        report_date,
+        shares_1,
+        price_1,
+        fx_rate_1
+    FROM merge
+    WHERE %(carry_state)s
+    ORDER BY client_account_id, symbol, report_date DESC
+    ON CONFLICT (client_account_id, symbol)
+    DO UPDATE SET
+        report_date = EXCLUDED.report_date,
+        shares = EXCLUDED.shares,
+        price = EXCLUDED.price,
+        fx_rate = EXCLUDED.fx_rate
+    -- Reruns of older windows never move the state backwards.
+    WHERE EXCLUDED.report_date >= holding_state.report_date
+),
 shift AS (
     SELECT
         client_account_id,
@@ -93,8 +241,9 @@ shift AS (
         COALESCE(average_trade_price, 0) AS average_trade_price,
         COALESCE(LAG(fx_rate_1) OVER (PARTITION BY client_account_id, symbol ORDER BY report_date), fx_rate_1) AS fx_rate_0,
         COALESCE(LAG(shares_1) OVER (PARTITION BY client_account_id, symbol ORDER BY report_date), shares_1) AS shares_0,
-        COALESCE(LAG(price_1) OVER (PARTITION BY client_account_id, symbol ORDER BY report_date), price_1) AS price_0
-    FROM merge
+        COALESCE(LAG(price_1) OVER (PARTITION BY client_account_id, symbol ORDER BY report_date), price_1) AS price_0,
+        is_seed
+    FROM seeded
 ),
 adjustments AS(
     SELECT
@@ -132,6 +281,7 @@ adjustments AS(
         dividends,
         dividends_per_share
     FROM shift
+    WHERE NOT is_seed
 ),
 returns AS(
     SELECT
@@ -154,30 +304,91 @@ returns AS(
         dividends_per_share
     FROM adjustments a
     INNER JOIN calendar_new c ON a.report_date = c.date
+),
+-- Values are rounded to the scales tools.returns rounds to (12 places for ratios,
+-- 6 for everything else), so both engines write identical values.
+source AS (
+    SELECT
+        date,
+        client_account_id,
+        ticker,
+        ROUND(weight, 12) AS weight,
+        ROUND(shares, 6) AS shares,
+        ROUND(price, 6) AS price,
+        ROUND(shares * price, 6) AS value,
+        ROUND(shares_traded, 6) AS shares_traded,
+        ROUND(average_trade_price, 6) AS average_trade_price,
+        ROUND(return, 12) AS return,
+        ROUND(dividends, 6) AS dividends,
+        ROUND(dividends_per_share, 6) AS dividends_per_share
+    FROM returns
+),
+merged AS (
+    INSERT INTO holding_returns (
+        date,
+        client_account_id,
+        ticker,
+        weight,
+        shares,
+        price,
+        value,
+        shares_traded,
+        average_trade_price,
+        return,
+        dividends,
+        dividends_per_share
+    )
+    SELECT
+        date,
+        client_account_id,
+        ticker,
+        weight,
+        shares,
+        price,
+        value,
+        shares_traded,
+        average_trade_price,
+        return,
+        dividends,
+        dividends_per_share
+    FROM source
+    ON CONFLICT (date, client_account_id, ticker)
+    DO UPDATE SET
+        weight = EXCLUDED.weight,
+        shares = EXCLUDED.shares,
+        price = EXCLUDED.price,
+        value = EXCLUDED.value,
+        shares_traded = EXCLUDED.shares_traded,
+        average_trade_price = EXCLUDED.average_trade_price,
+        return = EXCLUDED.return,
+        dividends = EXCLUDED.dividends,
+        dividends_per_share = EXCLUDED.dividends_per_share
+    WHERE (
+        holding_returns.weight,
+        holding_returns.shares,
+        holding_returns.price,
+        holding_returns.value,
+        holding_returns.shares_traded,
+        holding_returns.average_trade_price,
+        holding_returns.return,
+        holding_returns.dividends,
+        holding_returns.dividends_per_share
+    ) IS DISTINCT FROM (
+        EXCLUDED.weight,
+        EXCLUDED.shares,
+        EXCLUDED.price,
+        EXCLUDED.value,
+        EXCLUDED.shares_traded,
+        EXCLUDED.average_trade_price,
+        EXCLUDED.return,
+        EXCLUDED.dividends,
+        EXCLUDED.dividends_per_share
+    )
+    RETURNING (xmax = 0) AS inserted
 )
-SELECT 
-    date,
-    client_account_id,
-    ticker,
-    weight,
-    shares,
-    price,
-    shares * price AS value,
-    shares_traded,
-    average_trade_price,
-    return,
-    dividends,
-    dividends_per_share
-FROM returns
-ON CONFLICT (date, client_account_id, ticker)
-DO UPDATE SET
-    weight = EXCLUDED.weight, 
-    shares = EXCLUDED.shares, 
-    price = EXCLUDED.price, 
-    value = EXCLUDED.value, 
-    shares_traded = EXCLUDED.shares_traded,
-    average_trade_price = EXCLUDED.average_trade_price,
-    return = EXCLUDED.return, 
-    dividends = EXCLUDED.dividends, 
-    dividends_per_share = EXCLUDED.dividends_per_share
+SELECT
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM source) - COUNT(*) AS unchanged
+FROM merged
 ;
@@ -0,0 +1,75 @@
+-- Loads holding_returns computed outside the database (see tools.returns).
+-- Staged values are doubles, so they are rounded back to the scales the
+-- materialize script writes, and reloads through either engine compare equal.
+--
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO holding_returns (
+        date,
+        client_account_id,
+        ticker,
+        weight,
+        shares,
+        price,
+        value,
+        shares_traded,
+        average_trade_price,
+        return,
+        dividends,
+        dividends_per_share
+    )
+    SELECT
+        date,
+        client_account_id,
+        ticker,
+        ROUND(weight::NUMERIC, 12),
+        ROUND(shares::NUMERIC, 6),
+        ROUND(price::NUMERIC, 6),
+        ROUND(value::NUMERIC, 6),
+        ROUND(shares_traded::NUMERIC, 6),
+        ROUND(average_trade_price::NUMERIC, 6),
+        ROUND(return::NUMERIC, 12),
+        ROUND(dividends::NUMERIC, 6),
+        ROUND(dividends_per_share::NUMERIC, 6)
+    FROM "{{stage_table}}"
+    ON CONFLICT (date, client_account_id, ticker)
+    DO UPDATE SET
+        weight = EXCLUDED.weight,
+        shares = EXCLUDED.shares,
+        price = EXCLUDED.price,
+        value = EXCLUDED.value,
+        shares_traded = EXCLUDED.shares_traded,
+        average_trade_price = EXCLUDED.average_trade_price,
+        return = EXCLUDED.return,
+        dividends = EXCLUDED.dividends,
+        dividends_per_share = EXCLUDED.dividends_per_share
+    WHERE (
+        holding_returns.weight,
+        holding_returns.shares,
+        holding_returns.price,
+        holding_returns.value,
+        holding_returns.shares_traded,
+        holding_returns.average_trade_price,
+        holding_returns.return,
+        holding_returns.dividends,
+        holding_returns.dividends_per_share
+    ) IS DISTINCT FROM (
+        EXCLUDED.weight,
+        EXCLUDED.shares,
+        EXCLUDED.price,
+        EXCLUDED.value,
+        EXCLUDED.shares_traded,
+        EXCLUDED.average_trade_price,
+        EXCLUDED.return,
+        EXCLUDED.dividends,
+        EXCLUDED.dividends_per_share
+    )
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
+;
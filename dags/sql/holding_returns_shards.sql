@@ -0,0 +1,17 @@
+-- (account, month) shards of a holding returns reload: every month an account
+-- has positions or trades in.
+SELECT
+    client_account_id,
+    DATE_TRUNC('month', report_date)::DATE AS month
+FROM positions_new
+WHERE report_date BETWEEN %(start_date)s AND %(end_date)s
+GROUP BY client_account_id, DATE_TRUNC('month', report_date)
+UNION
+SELECT
+    client_account_id,
+    DATE_TRUNC('month', report_date)::DATE AS month
+FROM trades_new
+WHERE report_date BETWEEN %(start_date)s AND %(end_date)s
+GROUP BY client_account_id, DATE_TRUNC('month', report_date)
+ORDER BY month, client_account_id
+;
@@ -0,0 +1,12 @@
+-- Last row of each (account, symbol) seen by holding_returns_materialize.sql.
+-- Values are the raw positions values of that row, NULL on days with trades only.
+CREATE TABLE IF NOT EXISTS holding_state (
+    client_account_id TEXT,
+    symbol TEXT,
+    report_date DATE,
+    shares NUMERIC,
+    price NUMERIC,
+    fx_rate NUMERIC,
+    PRIMARY KEY (client_account_id, symbol)
+)
+;
@@ -0,0 +1,47 @@
+-- Loads a recomputed holding state. Unlike holding_returns_materialize.sql, the
+-- staged state replaces the stored one, even if it is older.
+--
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO holding_state (
+        client_account_id,
+        symbol,
+        report_date,
+        shares,
+        price,
+        fx_rate
+    )
+    SELECT
+        client_account_id,
+        symbol,
+        report_date,
+        shares,
+        price,
+        fx_rate
+    FROM "{{stage_table}}"
+    ON CONFLICT (client_account_id, symbol)
+    DO UPDATE SET
+        report_date = EXCLUDED.report_date,
+        shares = EXCLUDED.shares,
+        price = EXCLUDED.price,
+        fx_rate = EXCLUDED.fx_rate
+    WHERE (
+        holding_state.report_date,
+        holding_state.shares,
+        holding_state.price,
+        holding_state.fx_rate
+    ) IS DISTINCT FROM (
+        EXCLUDED.report_date,
+        EXCLUDED.shares,
+        EXCLUDED.price,
+        EXCLUDED.fx_rate
+    )
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
+;
@@ -0,0 +1,81 @@
+-- Rebuilds holding_state as of end_date from the source tables, for after runs
+-- that did not carry it forward (see holding_returns_materialize.sql).
+--
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH last_rows AS (
+    SELECT DISTINCT ON (client_account_id, symbol)
+        client_account_id,
+        symbol,
+        report_date
+    FROM (
+        SELECT client_account_id, symbol, report_date
+        FROM positions_new
+        WHERE sub_category IN ('ETF', 'COMMON', 'ADR')
+            AND report_date <= %(end_date)s
+        UNION ALL
+        SELECT client_account_id, symbol, report_date
+        FROM trades_new
+        WHERE sub_category IN ('ETF', 'COMMON', 'ATR')
+            AND report_date <= %(end_date)s
+        GROUP BY client_account_id, symbol, report_date
+        HAVING SUM(quantity) != 0
+    ) rows
+    ORDER BY client_account_id, symbol, report_date DESC
+),
+source AS (
+    SELECT
+        l.client_account_id,
+        l.symbol,
+        l.report_date,
+        p.quantity AS shares,
+        p.mark_price AS price,
+        p.fx_rate_to_base AS fx_rate
+    FROM last_rows l
+    LEFT JOIN positions_new p ON p.client_account_id = l.client_account_id
+        AND p.report_date = l.report_date
+        AND p.symbol = l.symbol
+        AND p.sub_category IN ('ETF', 'COMMON', 'ADR')
+),
+merged AS (
+    INSERT INTO holding_state (
+        client_account_id,
+        symbol,
+        report_date,
+        shares,
+        price,
+        fx_rate
+    )
+    SELECT
+        client_account_id,
+        symbol,
+        report_date,
+        shares,
+        price,
+        fx_rate
+    FROM source
+    ON CONFLICT (client_account_id, symbol)
+    DO UPDATE SET
+        report_date = EXCLUDED.report_date,
+        shares = EXCLUDED.shares,
+        price = EXCLUDED.price,
+        fx_rate = EXCLUDED.fx_rate
+    WHERE (
+        holding_state.report_date,
+        holding_state.shares,
+        holding_state.price,
+        holding_state.fx_rate
+    ) IS DISTINCT FROM (
+        EXCLUDED.report_date,
+        EXCLUDED.shares,
+        EXCLUDED.price,
+        EXCLUDED.fx_rate
+    )
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM source) - COUNT(*) AS unchanged
+FROM merged
+;
@@ -0,0 +1,16 @@
+-- One row per shard of a sharded reload, keyed by the Airflow run that planned it.
+-- client_account_id is '*' for shards covering every account.
+CREATE TABLE IF NOT EXISTS materialization_progress (
+    run_id TEXT,
+    table_name TEXT,
+    client_account_id TEXT,
+    month DATE,
+    status TEXT,
+    inserted BIGINT,
+    updated BIGINT,
+    unchanged BIGINT,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    PRIMARY KEY (run_id, table_name, client_account_id, month)
+)
+;
@@ -0,0 +1,29 @@
+-- Records planned shards as pending. Shards already recorded for the run keep
+-- their status, so replanning a run resumes it.
+--
+-- The counts of inserted and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO materialization_progress (
+        run_id,
+        table_name,
+        client_account_id,
+        month,
+        status
+    )
+    SELECT
+        run_id,
+        table_name,
+        client_account_id,
+        month,
+        'pending'
+    FROM "{{stage_table}}"
+    ON CONFLICT (run_id, table_name, client_account_id, month)
+    DO NOTHING
+    RETURNING TRUE AS inserted
+)
+SELECT
+    COUNT(*) AS inserted,
+    0 AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
+;
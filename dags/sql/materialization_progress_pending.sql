@@ -0,0 +1,10 @@
+-- Shards of a run that have not finished, oldest month first.
+SELECT
+    client_account_id,
+    month
+FROM materialization_progress
+WHERE run_id = %(run_id)s
+    AND table_name = %(table_name)s
+    AND status != 'done'
+ORDER BY month, client_account_id
+;
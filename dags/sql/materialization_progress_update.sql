@@ -0,0 +1,13 @@
+UPDATE materialization_progress
+SET
+    status = %(status)s,
+    inserted = %(inserted)s,
+    updated = %(updated)s,
+    unchanged = %(unchanged)s,
+    started_at = CASE WHEN %(status)s = 'running' THEN NOW() ELSE started_at END,
+    finished_at = CASE WHEN %(status)s = 'running' THEN NULL ELSE NOW() END
+WHERE run_id = %(run_id)s
+    AND table_name = %(table_name)s
+    AND client_account_id = %(client_account_id)s
+    AND month = %(month)s
+;
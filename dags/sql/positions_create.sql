@@ -1,3 +1,4 @@
+-- Range partitioned by month. Partitions are created by RDS.ensure_month_partitions.
 CREATE TABLE IF NOT EXISTS positions_new (
     report_date DATE,
     client_account_id TEXT,
@@ -11,5 +12,9 @@ CREATE TABLE IF NOT EXISTS positions_new (
     quantity NUMERIC,
     fx_rate_to_base NUMERIC,
     PRIMARY KEY (report_date, client_account_id, symbol)
-)
+) PARTITION BY RANGE (report_date)
+;
+
+-- Finds a holding's last row before a date (holding_returns_materialize.sql).
+CREATE INDEX IF NOT EXISTS positions_new_holding_idx ON positions_new (client_account_id, symbol, report_date)
 ;
@@ -1,37 +1,66 @@
-INSERT INTO positions_new (
-    report_date,
-    client_account_id,
-    asset_class,
-    sub_category,
-    description,
-    cusip,
-    isin,
-    symbol,
-    mark_price,
-    quantity,
-    fx_rate_to_base
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO positions_new (
+        report_date,
+        client_account_id,
+        asset_class,
+        sub_category,
+        description,
+        cusip,
+        isin,
+        symbol,
+        mark_price,
+        quantity,
+        fx_rate_to_base
+    )
+    SELECT
+        report_date,
+        client_account_id,
+        asset_class,
+        sub_category,
+        description,
+        cusip,
+        isin,
+        symbol,
+        mark_price,
+        quantity,
+        fx_rate_to_base
+    FROM "{{stage_table}}"
+    ON CONFLICT (report_date, client_account_id, symbol)
+    DO UPDATE SET
+        asset_class = EXCLUDED.asset_class,
+        sub_category = EXCLUDED.sub_category,
+        description = EXCLUDED.description,
+        cusip = EXCLUDED.cusip,
+        isin = EXCLUDED.isin,
+        mark_price = EXCLUDED.mark_price,
+        quantity = EXCLUDED.quantity,
+        fx_rate_to_base = EXCLUDED.fx_rate_to_base
+    WHERE (
+        positions_new.asset_class,
+        positions_new.sub_category,
+        positions_new.description,
+        positions_new.cusip,
+        positions_new.isin,
+        positions_new.mark_price,
+        positions_new.quantity,
+        positions_new.fx_rate_to_base
+    ) IS DISTINCT FROM (
+        EXCLUDED.asset_class,
+        EXCLUDED.sub_category,
+        EXCLUDED.description,
+        EXCLUDED.cusip,
+        EXCLUDED.isin,
+        EXCLUDED.mark_price,
+        EXCLUDED.quantity,
+        EXCLUDED.fx_rate_to_base
+    )
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    report_date,
-    client_account_id,
-    asset_class,
-    sub_category,
-    description,
-    cusip,
-    isin,
-    symbol,
-    mark_price,
-    quantity,
-    fx_rate_to_base
-FROM "{{stage_table}}"
-ON CONFLICT (report_date, client_account_id, symbol)
-DO UPDATE SET
-    asset_class = EXCLUDED.asset_class,
-    sub_category = EXCLUDED.sub_category,
-    description = EXCLUDED.description,
-    cusip = EXCLUDED.cusip,
-    isin = EXCLUDED.isin,
-    mark_price = EXCLUDED.mark_price,
-    quantity = EXCLUDED.quantity,
-    fx_rate_to_base = EXCLUDED.fx_rate_to_base
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
 ;
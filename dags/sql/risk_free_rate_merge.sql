@@ -1,11 +1,21 @@
-INSERT INTO risk_free_rate_new (
-    date,
-    return
+-- Existing rows are left untouched, and the counts of inserted, updated and
+-- unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO risk_free_rate_new (
+        date,
+        return
+    )
+    SELECT
+        date,
+        return
+    FROM "{{stage_table}}"
+    ON CONFLICT (date)
+    DO NOTHING
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    date,
-    return
-FROM "{{stage_table}}"
-ON CONFLICT (date)
-DO NOTHING
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
 ;
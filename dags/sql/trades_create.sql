@@ -1,3 +1,4 @@
+-- Range partitioned by month. Partitions are created by RDS.ensure_month_partitions.
 CREATE TABLE IF NOT EXISTS trades_new (
     report_date DATE,
     client_account_id TEXT,
@@ -13,5 +14,9 @@ CREATE TABLE IF NOT EXISTS trades_new (
     ib_commission NUMERIC,
     buy_sell TEXT,
     PRIMARY KEY (report_date, client_account_id, symbol, trade_id)
-)
+) PARTITION BY RANGE (report_date)
+;
+
+-- Finds a holding's last row before a date (holding_returns_materialize.sql).
+CREATE INDEX IF NOT EXISTS trades_new_holding_idx ON trades_new (client_account_id, symbol, report_date)
 ;
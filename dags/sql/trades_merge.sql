@@ -1,42 +1,73 @@
-INSERT INTO trades_new (
-    report_date,
-    client_account_id,
-    asset_class,
-    sub_category,
-    description,
-    cusip,
-    isin,
-    symbol,
-    trade_id,
-    quantity,
-    trade_price,
-    ib_commission,
-    buy_sell
+-- Rows whose values are unchanged are skipped, and the counts of inserted,
+-- updated and unchanged rows are returned.
+WITH merged AS (
+    INSERT INTO trades_new (
+        report_date,
+        client_account_id,
+        asset_class,
+        sub_category,
+        description,
+        cusip,
+        isin,
+        symbol,
+        trade_id,
+        quantity,
+        trade_price,
+        ib_commission,
+        buy_sell
+    )
+    SELECT
+        report_date,
+        client_account_id,
+        asset_class,
+        sub_category,
+        description,
+        cusip,
+        isin,
+        symbol,
+        trade_id,
+        quantity,
+        trade_price,
+        ib_commission,
+        buy_sell
+    FROM "{{stage_table}}"
+    ON CONFLICT (report_date, client_account_id, symbol, trade_id)
+    DO UPDATE SET
+        asset_class = EXCLUDED.asset_class,
+        sub_category = EXCLUDED.sub_category,
+        description = EXCLUDED.description,
+        cusip = EXCLUDED.cusip,
+        isin = EXCLUDED.isin,
+        quantity = EXCLUDED.quantity,
+        trade_price = EXCLUDED.trade_price,
+        ib_commission = EXCLUDED.ib_commission,
+        buy_sell = EXCLUDED.buy_sell
+    WHERE (
+        trades_new.asset_class,
+        trades_new.sub_category,
+        trades_new.description,
+        trades_new.cusip,
+        trades_new.isin,
+        trades_new.quantity,
+        trades_new.trade_price,
+        trades_new.ib_commission,
+        trades_new.buy_sell
+    ) IS DISTINCT FROM (
+        EXCLUDED.asset_class,
+        EXCLUDED.sub_category,
+        EXCLUDED.description,
+        EXCLUDED.cusip,
+        EXCLUDED.isin,
+        EXCLUDED.quantity,
+        EXCLUDED.trade_price,
+        EXCLUDED.ib_commission,
+        EXCLUDED.buy_sell
+    )
+    RETURNING (xmax = 0) AS inserted
 )
 SELECT
-    report_date,
-    client_account_id,
-    asset_class,
-    sub_category,
-    description,
-    cusip,
-    isin,
-    symbol,
-    trade_id,
-    quantity,
-    trade_price,
-    ib_commission,
-    buy_sell
-FROM "{{stage_table}}"
-ON CONFLICT (report_date, client_account_id, symbol, trade_id)
-DO UPDATE SET
-    asset_class = EXCLUDED.asset_class,
-    sub_category = EXCLUDED.sub_category,
-    description = EXCLUDED.description,
-    cusip = EXCLUDED.cusip,
-    isin = EXCLUDED.isin,
-    quantity = EXCLUDED.quantity,
-    trade_price = EXCLUDED.trade_price,
-    ib_commission = EXCLUDED.ib_commission,
-    buy_sell = EXCLUDED.buy_sell
+    COUNT(*) FILTER (WHERE inserted) AS inserted,
+    COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+    (SELECT COUNT(*) FROM "{{stage_table}}") - COUNT(*) AS unchanged
+FROM merged
 ;
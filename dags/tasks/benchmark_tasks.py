@@ -55,15 +55,9 @@ def benchmark_etl_daily() -> None:
     )
     db.execute_sql_file('dags/sql/benchmark_create.sql')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{last_market_date}_BENCHMARK"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/benchmark_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
+    db.stage_and_merge(df, stage_table, 'dags/sql/benchmark_merge.sql')
 
 @task(task_id="benchmark_etl")
 def benchmark_etl_backfill(from_date: dt.date, to_date: dt.date) -> None:
@@ -80,15 +74,9 @@ def benchmark_etl_backfill(from_date: dt.date, to_date: dt.date) -> None:
     )
     db.execute_sql_file('dags/sql/benchmark_create.sql')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{from_date}_{to_date}_BENCHMARK"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/benchmark_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
+    db.stage_and_merge(df, stage_table, 'dags/sql/benchmark_merge.sql')
 
 @task(task_id='benchmark_etl')
 def benchmark_etl_reload() -> None:
@@ -108,12 +96,6 @@ def benchmark_etl_reload() -> None:
     )
     db.execute_sql_file('dags/sql/benchmark_create.sql')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{from_date}_{to_date}_BENCHMARK"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/benchmark_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
\ No newline at end of file
+    db.stage_and_merge(df, stage_table, 'dags/sql/benchmark_merge.sql')
\ No newline at end of file
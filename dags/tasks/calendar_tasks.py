@@ -3,23 +3,13 @@ import aws
 import datetime as dt
 import dateutil.relativedelta as du
 import os
-import pandas_market_calendars as mcal
 import polars as pl
 import config
 from airflow.sdk import task
 
 def get_market_calendar(start_date: dt.date, end_date: dt.date, exchange: str = 'NYSE') -> pl.DataFrame:
-    # Load market calendar
-    calendar = mcal.get_calendar(exchange)
-
-    # Get schedule
-    schedule = calendar.schedule(start_date=start_date.isoformat(), end_date=end_date.isoformat())
-
-    # Extract only the trading dates (from the market open times)
-    trading_days = schedule.index.date
-
-    # Convert to Polars DataFrame
-    return pl.DataFrame({"date": trading_days})
+    # Trading days come from the shared, precomputed trading calendar
+    return tools.get_market_calendar_df(start_date, end_date, exchange)
 
 @task(task_id="calendar_etl")
 def calendar_etl_daily() -> None:
@@ -39,15 +29,9 @@ def calendar_etl_daily() -> None:
     )
     db.execute_sql_file('dags/sql/calendar_create.sql')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{last_market_date}_CALENDAR"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/calendar_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
+    db.stage_and_merge(df, stage_table, 'dags/sql/calendar_merge.sql')
 
 @task(task_id="calendar_etl")
 def calendar_etl_backfill(from_date: dt.date, to_date: dt.date) -> None:
@@ -64,15 +48,9 @@ def calendar_etl_backfill(from_date: dt.date, to_date: dt.date) -> None:
     )
     db.execute_sql_file('dags/sql/calendar_create.sql')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{from_date}_{to_date}_CALENDAR"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/calendar_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
+    db.stage_and_merge(df, stage_table, 'dags/sql/calendar_merge.sql')
 
 @task(task_id="calendar_etl")
 def calendar_etl_reload() -> None:
@@ -92,12 +70,6 @@ def calendar_etl_reload() -> None:
     )
     db.execute_sql_file('dags/sql/calendar_create.sql')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{from_date}_{to_date}_CALENDAR"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/calendar_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
\ No newline at end of file
+    db.stage_and_merge(df, stage_table, 'dags/sql/calendar_merge.sql')
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+import datetime as dt
+import polars as pl
+import fsspec
+import aws
+import dotenv
+from collections import defaultdict
+from airflow.sdk import task, task_group
+from tasks.landing import CLEANERS
+from tasks.partitions import (
+    BUCKET_NAME,
+    COMPACTED_FILE,
+    DATE_COLUMNS,
+    LANDING_PREFIX,
+    dedupe,
+    get_storage_options,
+    landing_order,
+    legacy_fund,
+    list_legacy_files,
+    read_legacy_files,
+    partition_path,
+    read_manifest,
+    write_manifest,
+)
+
+dotenv.load_dotenv(override=True)
+
+@task
+def compact_dataset(dataset: str) -> None:
+    """Compact every closed month of a dataset into one Parquet file per fund.
+
+    Legacy CSVs covering only closed months are migrated into the partitions and
+    recorded in the manifest, so reloads stop reading them one by one. The manifest
+    is written after every partition, so a failed run keeps the progress it made.
+    """
+    storage_options = get_storage_options()
+    fs = fsspec.filesystem("s3", **storage_options)
+
+    s3 = aws.S3(
+        aws_access_key_id=os.getenv('COGNITO_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('COGNITO_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('COGNITO_REGION'),
+    )
+
+    date_column = DATE_COLUMNS[dataset]
+    current_month_start = dt.date.today().replace(day=1)
+    current_month = current_month_start.strftime('%Y-%m')
+    manifest = read_manifest(dataset)
+
+    # 1. Group landed files by partition, oldest landing first, noting the version of each
+    landed_files = defaultdict(list)
+    etags = {}
+    landed = fs.find(f"{BUCKET_NAME}/{LANDING_PREFIX}/dataset={dataset}/", detail=True)
+    for file, info in sorted(landed.items(), key=lambda item: landing_order(*item)):
+        if not file.endswith('.parquet'):
+            continue
+
+        fund, month = [part.split('=', 1)[1] for part in file.split('/')[-3:-1]]
+        landed_files[(fund, month)].append(file)
+        etags[file] = info['ETag']
+
+    # 2. Read legacy CSVs whose rows all fall in closed months
+    legacy_dfs = defaultdict(list)
+    pending_files = {}
+    legacy_files = list_legacy_files(dataset)
+    for file, df in zip(legacy_files, read_legacy_files(legacy_files, dataset, CLEANERS[dataset])):
+        if not df.is_empty() and df[date_column].max() >= current_month_start:
+            continue
+
+        fund = legacy_fund(file)
+        if fund is None:
+            print(f"Skipping {file}: no configured fund matches its path")
+            continue
+
+        month = pl.col(date_column).dt.strftime('%Y-%m').alias('month')
+        partitions = df.with_columns(month).partition_by('month', as_dict=True)
+
+        for (partition_month,), partition in partitions.items():
+            legacy_dfs[(fund, partition_month)].append(partition.drop('month'))
+
+        # A legacy file is migrated once every partition it has rows in is compacted.
+        pending_files[file] = {(fund, partition_month) for (partition_month,) in partitions}
+
+    def record_migrated_files(done: set[tuple[str, str]]) -> None:
+        migrated_files = [file for file, partitions in pending_files.items() if partitions <= done]
+        manifest['legacy_files'] = sorted(set(manifest['legacy_files']) | set(migrated_files))
+
+    compacted = set()
+    record_migrated_files(compacted)
+
+    # 3. Merge each closed partition into a single deduplicated, sorted file
+    for fund, month in sorted(landed_files.keys() | legacy_dfs.keys()):
+        if month >= current_month:
+            continue
+
+        compacted_file = f"{partition_path(dataset, fund, month)}/{COMPACTED_FILE}"
+        source_files = landed_files[(fund, month)]
+
+        if source_files == [f"{BUCKET_NAME}/{compacted_file}"] and not legacy_dfs[(fund, month)]:
+            continue
+
+        # Legacy rows first, then landed files in landing order, so the latest landing of a key wins.
+        dfs = list(legacy_dfs[(fund, month)])
+        if source_files:
+            dfs.append(pl.scan_parquet([f"s3://{file}" for file in source_files], hive_partitioning=False, storage_options=storage_options).collect())
+
+        df = dedupe(pl.concat(dfs).lazy(), dataset).sort(date_column, 'client_account_id').collect()
+
+        s3.drop_file(file_name=compacted_file, bucket_name=BUCKET_NAME, file_data=df, file_format='parquet')
+
+        # 4. Record the partition, and the legacy files now fully migrated, before deleting anything
+        manifest['partitions'][f"fund={fund}/month={month}"] = {
+            'file': compacted_file,
+            'rows': df.height,
+            'source_files': len(source_files) + len(legacy_dfs[(fund, month)]),
+            'compacted_at': dt.datetime.now(dt.timezone.utc).isoformat(),
+        }
+        compacted.add((fund, month))
+        record_migrated_files(compacted)
+        write_manifest(dataset, manifest)
+
+        # 5. Delete the files read, unless a backfill has rewritten them since they were listed.
+        # Kept files are read after the compacted file (see landing_order), so their rows win.
+        # Readers deduplicate, so a failure before deleting only leaves extra copies behind.
+        stale_files = []
+        for file in source_files:
+            if file == f"{BUCKET_NAME}/{compacted_file}":
+                continue
+
+            if fs.info(file, refresh=True)['ETag'] != etags[file]:
+                print(f"Keeping {file}: rewritten since it was read")
+                continue
+
+            stale_files.append(file)
+
+        if stale_files:
+            fs.rm(stale_files)
+
+        print(f"Compacted {dataset} {fund} {month}: {len(source_files)} files into {df.height} rows")
+
+    write_manifest(dataset, manifest)
+
+@task_group
+def compaction():
+    for dataset in DATE_COLUMNS:
+        compact_dataset.override(task_id=f"{dataset}_compact")(dataset)
@@ -1,11 +1,14 @@
+import functools
 import tools
 import datetime as dt
 import dateutil.relativedelta as du
 import aws
 import os
 import dotenv
+from typing import IO
 from airflow.sdk import task, task_group
 from config import configs
+from tasks.landing import land_statement
 
 dotenv.load_dotenv(override=True)
 
@@ -13,9 +16,9 @@ dotenv.load_dotenv(override=True)
 def extract_and_store_task_daily(config: dict, query: str) -> None:
     yesterday = dt.date.today() - du.relativedelta(days=1)
     last_market_date = tools.get_last_market_date(reference_date=yesterday)
-    
-    # 1. Pull data from IBKR
-    df = tools.ibkr_query(
+
+    # 1. Stream raw statement from IBKR
+    chunks = tools.ibkr_query_stream(
         token=config['token'],
         query_id=config['queries'][query],
         from_date=last_market_date,
@@ -29,40 +32,71 @@ def extract_and_store_task_daily(config: dict, query: str) -> None:
         region_name=os.getenv('COGNITO_REGION'),
     )
 
-    file_name = f"daily-files/{last_market_date}/{config['fund']}/{last_market_date}-{config['fund']}-{query}.csv"
-    s3.drop_file(file_name=file_name, bucket_name='ibkr-flex-query-files', file_data=df)
+    with tools.spool_chunks(chunks) as file:
+        land_statement(s3, file, fund=config['fund'], name=str(last_market_date), query=query)
 
 @task
-def extract_and_store_task_backfill(config: dict, query: str, from_date: dt.date, to_date: dt.date):
-    # pass
-    # 1. Pull data from IBKR
-    df = tools.ibkr_query_batches(
+def extract_and_store_statement_task_daily(config: dict) -> None:
+    yesterday = dt.date.today() - du.relativedelta(days=1)
+    last_market_date = tools.get_last_market_date(reference_date=yesterday)
+
+    # 1. Stream the combined raw statement from IBKR
+    chunks = tools.ibkr_query_stream(
         token=config['token'],
-        query_id=config['queries'][query],
-        from_date=from_date,
-        to_date=to_date
+        query_id=config['queries']['statement'],
+        from_date=last_market_date,
+        to_date=last_market_date
     )
 
-    # 2. Save to S3
+    # 2. Split into sections and save to S3
     s3 = aws.S3(
         aws_access_key_id=os.getenv('COGNITO_ACCESS_KEY_ID'),
         aws_secret_access_key=os.getenv('COGNITO_SECRET_ACCESS_KEY'),
         region_name=os.getenv('COGNITO_REGION'),
     )
 
-    file_name = f"backfill-files/{from_date}_{to_date}/{config['fund']}/{from_date}_{to_date}-{config['fund']}-{query}.csv"
-    s3.drop_file(file_name=file_name, bucket_name='ibkr-flex-query-files', file_data=df)
+    with tools.spool_chunks(chunks) as file:
+        land_statement(s3, file, fund=config['fund'], name=str(last_market_date), query='statement')
 
-@task_group
-def exctract_and_store_group_daily(query: str):
+@task(task_id="extract_and_store")
+def extract_and_store_task_backfill(queries: list[str], from_date: dt.date, to_date: dt.date):
+    tools.validate_backfill_dates(from_date, to_date)
+
+    s3 = aws.S3(
+        aws_access_key_id=os.getenv('COGNITO_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('COGNITO_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('COGNITO_REGION'),
+    )
+
+    # 1. Build a job for every fund, query and date window
+    funds = {}
+    jobs = []
     for config in configs:
-        extract_and_store_task_daily.override(task_id=f"{config['fund']}_{query}_extract_and_store")(config, query)
+        # Funds with a combined statement query need one request per window
+        fund_queries = ['statement'] if 'statement' in config['queries'] else queries
+        for query in fund_queries:
+            query_id = config['queries'][query]
+            funds[query_id] = (config['fund'], query)
+            is_cached = functools.partial(tools.default_cache.contains, query_id, flex_version=3)
+            for start, end in tools.default_planner.plan(query_id, from_date, to_date, is_cached):
+                jobs.append(tools.FlexJob(config['token'], query_id, start, end))
+
+    # 2. Pull from IBKR concurrently, landing each statement in S3 as it arrives.
+    # A failed statement does not stop the others: every success is landed before
+    # the task fails with all the errors, and a retry serves those from the cache.
+    def store(job: tools.FlexJob, file: IO[bytes]) -> None:
+        fund, query = funds[job.query_id]
+        land_statement(s3, file, fund=fund, name=f"{job.from_date}_{job.to_date}", query=query)
+
+    tools.ibkr_query_many(jobs, parse=store)
 
 @task_group
-def exctract_and_store_group_backfill(query: str, from_date: dt.date, to_date: dt.date) -> None:
-    # pass
+def exctract_and_store_group_daily(query: str):
     for config in configs:
-        extract_and_store_task_backfill.override(task_id=f"{config['fund']}_{query}_extract_and_store")(config, query, from_date, to_date)
+        if 'statement' in config['queries']:
+            continue
+
+        extract_and_store_task_daily.override(task_id=f"{config['fund']}_{query}_extract_and_store")(config, query)
 
 @task_group
 def ibkr_to_s3_daily():
@@ -70,8 +104,12 @@ def ibkr_to_s3_daily():
     for query in queries:
         exctract_and_store_group_daily.override(group_id=f"{query}_extract_and_store")(query)
 
+    # Funds with a combined statement query pull every section in one request
+    for config in configs:
+        if 'statement' in config['queries']:
+            extract_and_store_statement_task_daily.override(task_id=f"{config['fund']}_statement_extract_and_store")(config)
+
 @task_group
 def ibkr_to_s3_backfill(from_date: dt.date, to_date: dt.date):
     queries = ['delta_nav', 'dividends', 'positions', 'trades']
-    for query in queries:
-        exctract_and_store_group_backfill.override(group_id=f"{query}_extract_and_store")(query, from_date, to_date)
\ No newline at end of file
+    extract_and_store_task_backfill(queries, from_date, to_date)
\ No newline at end of file
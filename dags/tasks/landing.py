@@ -0,0 +1,47 @@
+import tools
+import aws
+import config
+from typing import IO
+from tasks.s3_to_rds_sub_tasks.positions_task import clean_positions_data
+from tasks.s3_to_rds_sub_tasks.trades_task import clean_trades_data
+from tasks.s3_to_rds_sub_tasks.dividends_task import clean_dividends_data
+from tasks.s3_to_rds_sub_tasks.delta_nav_task import clean_delta_nav_data
+
+from tasks.partitions import BUCKET_NAME, write_partitions
+
+CLEANERS = {
+    'positions': clean_positions_data,
+    'trades': clean_trades_data,
+    'dividends': clean_dividends_data,
+    'delta_nav': clean_delta_nav_data,
+}
+
+def land_statement(s3: aws.S3, file: IO[bytes], fund: str, name: str, query: str) -> None:
+    """Land a raw IBKR statement in S3.
+
+    The raw CSV is archived byte for byte under `raw-files/` (if enabled in config),
+    then each dataset in the statement is cleaned and written as zstd Parquet to its
+    `landing/dataset={dataset}/fund={fund}/month={month}/` partitions.
+
+    Args:
+        s3 (aws.S3): S3 client.
+        file (IO[bytes]): Raw statement, positioned at the start.
+        fund (str): Fund the statement belongs to.
+        name (str): Date window the statement covers (e.g. `2025-06-02` or `2025-01-02_2025-06-30`).
+        query (str): Query the statement came from, or `statement` for a combined statement.
+    """
+    if config.archive_raw_files:
+        s3.upload_file_object(file_name=f"raw-files/query={query}/fund={fund}/{name}.csv", bucket_name=BUCKET_NAME, file_object=file)
+        file.seek(0)
+
+    # Routing also drops the header rows IBKR repeats for each account.
+    sections = tools.route_flex_sections(line.decode('utf-8') for line in file)
+
+    if query != 'statement' and sections.keys() - {query}:
+        raise Exception(f"Unexpected sections in {query} statement:", list(sections))
+
+    for dataset, section in sections.items():
+        df = CLEANERS[dataset](tools.read_flex_csv(section, dataset).lazy()).collect()
+        section.close()
+
+        write_partitions(s3, df, dataset=dataset, fund=fund, name=name)
@@ -0,0 +1,30 @@
+import aws
+import os
+from airflow.sdk import task, task_group
+
+# Tables partitioned by month: create script and the date column they are partitioned on.
+PARTITIONED_TABLES = {
+    'positions_new': ('dags/sql/positions_create.sql', 'report_date'),
+    'trades_new': ('dags/sql/trades_create.sql', 'report_date'),
+    'dividends_new': ('dags/sql/dividends_create.sql', 'report_date'),
+    'holding_returns': ('dags/sql/holding_returns_create.sql', 'date'),
+}
+
+@task
+def migrate_partitioned_table(table: str) -> None:
+    """Migrate one table to monthly partitions, or bring a partitioned one up to date."""
+    create_file, date_column = PARTITIONED_TABLES[table]
+
+    db = aws.RDS(
+        db_endpoint=os.getenv("DB_ENDPOINT"),
+        db_name=os.getenv("DB_NAME"),
+        db_user=os.getenv("DB_USER"),
+        db_password=os.getenv("DB_PASSWORD"),
+        db_port=os.getenv("DB_PORT"),
+    )
+    db.create_partitioned_table(create_file, table, date_column)
+
+@task_group
+def partition_migration():
+    for table in PARTITIONED_TABLES:
+        migrate_partitioned_table.override(task_id=f"{table}_migrate")(table)
@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import datetime as dt
+import fsspec
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+import polars as pl
+import tools
+import aws
+import dotenv
+from config import configs
+
+dotenv.load_dotenv(override=True)
+
+BUCKET_NAME = 'ibkr-flex-query-files'
+
+# Landed data is laid out as landing/dataset={dataset}/fund={fund}/month={YYYY-MM}/{name}.parquet
+LANDING_PREFIX = 'landing'
+
+# Column each dataset is partitioned by month on.
+DATE_COLUMNS = {
+    'positions': 'report_date',
+    'trades': 'report_date',
+    'dividends': 'report_date',
+    'delta_nav': 'date',
+}
+
+# Primary key of each dataset's core table. Restated rows are deduplicated on it.
+PRIMARY_KEYS = {
+    'positions': ['report_date', 'client_account_id', 'symbol'],
+    'trades': ['report_date', 'client_account_id', 'symbol', 'trade_id'],
+    'dividends': ['report_date', 'client_account_id', 'symbol', 'action_id'],
+    'delta_nav': ['date', 'client_account_id'],
+}
+
+# Number of legacy CSVs fetched from S3 at once.
+S3_READ_WORKERS = int(os.getenv('S3_READ_WORKERS', 16))
+
+# Name of the single file a closed month is compacted into.
+COMPACTED_FILE = 'compacted.parquet'
+
+def get_storage_options() -> dict[str, str]:
+    return {
+        "key": os.getenv('COGNITO_ACCESS_KEY_ID'),
+        "secret": os.getenv('COGNITO_SECRET_ACCESS_KEY'),
+    }
+
+def partition_path(dataset: str, fund: str, month: str) -> str:
+    return f"{LANDING_PREFIX}/dataset={dataset}/fund={fund}/month={month}"
+
+def manifest_path(dataset: str) -> str:
+    return f"{BUCKET_NAME}/{LANDING_PREFIX}/dataset={dataset}/_manifest.json"
+
+def read_manifest(dataset: str) -> dict:
+    """Read the compaction manifest of a dataset.
+
+    The manifest has one entry per compacted partition under `partitions` and lists the
+    legacy CSVs whose rows have been migrated into the partitions under `legacy_files`.
+    """
+    fs = fsspec.filesystem("s3", **get_storage_options())
+
+    if not fs.exists(manifest_path(dataset)):
+        return {'partitions': {}, 'legacy_files': []}
+
+    with fs.open(manifest_path(dataset), 'r') as file:
+        return json.load(file)
+
+def write_manifest(dataset: str, manifest: dict) -> None:
+    fs = fsspec.filesystem("s3", **get_storage_options())
+
+    with fs.open(manifest_path(dataset), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+def list_legacy_files(dataset: str) -> list[str]:
+    """List the legacy CSVs of a dataset that have not been migrated by compaction yet.
+
+    Legacy CSVs were landed under `history-files/`, `backfill-files/` and `daily-files/`
+    before the partitioned layout existed.
+    """
+    fs = fsspec.filesystem("s3", **get_storage_options())
+
+    source_patterns = [
+        f"s3://{BUCKET_NAME}/history-files/*/*{dataset}*.csv",
+        f"s3://{BUCKET_NAME}/backfill-files/*/*/*{dataset}.csv",
+        f"s3://{BUCKET_NAME}/daily-files/*/*/*{dataset}.csv",
+    ]
+
+    migrated = set(read_manifest(dataset)['legacy_files'])
+
+    return [file for source_pattern in source_patterns for file in fs.glob(source_pattern) if file not in migrated]
+
+def legacy_fund(file: str) -> str | None:
+    """Fund a legacy CSV belongs to, or None when it cannot be told from its path.
+
+    Daily and backfill files sit in a folder named after their fund. History files
+    do not, so the fund is matched against the configured funds as a whole folder
+    name or a whole word of the file name (`grad` does not match `undergrad`).
+    """
+    *folders, file_name = file.split('/')
+    funds = [config['fund'] for config in configs]
+
+    matches = {fund for fund in funds if fund in folders}
+    if not matches:
+        matches = {fund for fund in funds if re.search(rf"(?<![a-z0-9]){re.escape(fund)}(?![a-z0-9])", file_name)}
+
+    return matches.pop() if len(matches) == 1 else None
+
+def read_legacy_files(files: list[str], dataset: str, clean: Callable[[pl.LazyFrame], pl.LazyFrame], max_workers: int = S3_READ_WORKERS) -> list[pl.DataFrame]:
+    """Read and clean legacy CSVs concurrently.
+
+    Each read is dominated by S3 latency, so files are fetched and parsed on a bounded
+    thread pool. Results are returned in the same order as `files`.
+
+    Args:
+        files (list[str]): S3 paths as returned by `list_legacy_files`.
+        dataset (str): Dataset the files hold.
+        clean (Callable[[pl.LazyFrame], pl.LazyFrame]): Cleaning function of the dataset.
+        max_workers (int): Maximum number of files read at once.
+    """
+    storage_options = get_storage_options()
+
+    def read_file(file: str) -> pl.DataFrame:
+        return clean(scan_legacy_file(file, dataset, storage_options)).collect()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(read_file, files))
+
+def scan_legacy_file(file: str, dataset: str, storage_options: dict[str, str]) -> pl.LazyFrame:
+    """Lazily scan the source columns of a legacy CSV.
+
+    Legacy CSVs can carry the header rows IBKR repeats for each account as data rows,
+    so their columns are read as strings, without an inference pass, and typed by the
+    clean_* functions once those rows are filtered out.
+    """
+    schema = {column: pl.String for column in tools.SOURCE_SCHEMAS[dataset]}
+
+    return pl.scan_csv(f"s3://{file}", storage_options=storage_options, schema_overrides=schema, infer_schema=False).select(list(schema))
+
+def scan_legacy_files(files: list[str], dataset: str, clean: Callable[[pl.LazyFrame], pl.LazyFrame]) -> list[pl.LazyFrame]:
+    """Lazily scan and clean legacy CSVs, one plan per file.
+
+    Concatenating the plans lets polars read the files in parallel and stream them
+    through the cleaning steps instead of holding every file in memory.
+    """
+    storage_options = get_storage_options()
+
+    return [clean(scan_legacy_file(file, dataset, storage_options)) for file in files]
+
+def write_partitions(s3: aws.S3, df: pl.DataFrame, dataset: str, fund: str, name: str) -> None:
+    """Write a cleaned dataset to its monthly partitions as `{name}.parquet`.
+
+    Rerunning an extract for the same window overwrites the same files.
+
+    Args:
+        s3 (aws.S3): S3 client.
+        df (pl.DataFrame): Cleaned dataset.
+        dataset (str): Dataset name (e.g. `positions`).
+        fund (str): Fund the data belongs to.
+        name (str): File name within each partition, usually the date window pulled (e.g. `2025-06-02`).
+    """
+    month = pl.col(DATE_COLUMNS[dataset]).dt.strftime('%Y-%m').alias('month')
+
+    for (partition_month,), partition in df.with_columns(month).partition_by('month', as_dict=True).items():
+        s3.drop_file(
+            file_name=f"{partition_path(dataset, fund, partition_month)}/{name}.parquet",
+            bucket_name=BUCKET_NAME,
+            file_data=partition.drop('month'),
+            file_format='parquet',
+        )
+
+def dedupe(lf: pl.LazyFrame, dataset: str) -> pl.LazyFrame:
+    """Keep one row per primary key, the last one in frame order.
+
+    The same key can be landed more than once, e.g. by a daily extract and a later
+    backfill that restates it. Frames must be ordered from oldest to newest landing,
+    so the most recent version wins and the merge never sees a key twice.
+    """
+    return lf.unique(subset=PRIMARY_KEYS[dataset], keep='last', maintain_order=True)
+
+def landing_order(file: str, info: dict) -> tuple[bool, dt.datetime]:
+    """Sort key reading a partition's files from oldest to newest landing.
+
+    The compacted file comes first. It only holds rows of files compaction read and
+    deleted, so any file still next to it was landed or rewritten after it was read,
+    even when S3 reports it as modified before the compacted file was written.
+    """
+    return not file.endswith(f"/{COMPACTED_FILE}"), info['LastModified']
+
+def list_partition_files(dataset: str, funds: list[str] = None, from_date: dt.date = None, to_date: dt.date = None) -> list[str]:
+    """List the landed files of a dataset in the given funds and months, oldest landing first (see `landing_order`).
+
+    Args:
+        dataset (str): Dataset name (e.g. `positions`).
+        funds (list[str]): Funds to list. Lists every fund if None.
+        from_date (dt.date): First date needed (inclusive). Unbounded if None.
+        to_date (dt.date): Last date needed (inclusive). Unbounded if None.
+    """
+    fs = fsspec.filesystem("s3", **get_storage_options())
+
+    files = []
+    for file, info in fs.find(f"{BUCKET_NAME}/{LANDING_PREFIX}/dataset={dataset}/", detail=True).items():
+        if not file.endswith('.parquet'):
+            continue
+
+        fund, month = [part.split('=', 1)[1] for part in file.split('/')[-3:-1]]
+
+        if funds is not None and fund not in funds:
+            continue
+
+        if from_date is not None and month < from_date.strftime('%Y-%m'):
+            continue
+
+        if to_date is not None and month > to_date.strftime('%Y-%m'):
+            continue
+
+        files.append((landing_order(file, info), file))
+
+    return [f"s3://{file}" for _, file in sorted(files)]
+
+def empty_partitions(dataset: str) -> pl.LazyFrame:
+    """Empty frame in the cleaned schema of a dataset, as its landed files hold it."""
+    # Imported here because the cleaners' modules import this one.
+    from tasks.landing import CLEANERS
+
+    schema = {column: pl.String for column in tools.SOURCE_SCHEMAS[dataset]}
+    return CLEANERS[dataset](pl.LazyFrame(schema=schema))
+
+def scan_partitions(dataset: str, funds: list[str] = None, from_date: dt.date = None, to_date: dt.date = None) -> pl.LazyFrame:
+    """Lazily scan a landed dataset, pruning partitions by fund and date range.
+
+    Only the files of partitions that can hold matching rows are read. Files are read
+    oldest landing first and deduplicated on the primary key, so a restated row is
+    returned once, as last landed.
+
+    Args:
+        dataset (str): Dataset name (e.g. `positions`).
+        funds (list[str]): Funds to read. Reads every fund if None.
+        from_date (dt.date): First date to read (inclusive). Unbounded if None.
+        to_date (dt.date): Last date to read (inclusive). Unbounded if None.
+    """
+    files = list_partition_files(dataset, funds, from_date, to_date)
+
+    # polars cannot scan an empty file list, e.g. before anything has been landed.
+    if not files:
+        return empty_partitions(dataset)
+
+    lf = pl.scan_parquet(files, hive_partitioning=False, storage_options=get_storage_options())
+
+    date_column = DATE_COLUMNS[dataset]
+
+    if from_date is not None:
+        lf = lf.filter(pl.col(date_column) >= from_date)
+
+    if to_date is not None:
+        lf = lf.filter(pl.col(date_column) <= to_date)
+
+    return dedupe(lf, dataset)
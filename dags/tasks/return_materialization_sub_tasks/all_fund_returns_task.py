@@ -22,7 +22,7 @@ def all_fund_return_materializations_daily() -> None:
     db.execute_sql_file('dags/sql/all_fund_returns_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
+    db.execute_merge_template_file(
         file_name='dags/sql/all_fund_returns_materialize.sql',
         params={'start_date': last_market_date, 'end_date': last_market_date}
     )
@@ -40,7 +40,7 @@ def all_fund_return_materializations_backfill(from_date: dt.date, to_date: dt.da
     db.execute_sql_file('dags/sql/all_fund_returns_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
+    db.execute_merge_template_file(
         file_name='dags/sql/all_fund_returns_materialize.sql',
         params={'start_date': from_date, 'end_date': to_date}
     )
@@ -61,7 +61,15 @@ def all_fund_return_materializations_reload() -> None:
     db.execute_sql_file('dags/sql/all_fund_returns_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
-        file_name='dags/sql/all_fund_returns_materialize.sql',
-        params={'start_date': from_date, 'end_date': to_date}
-    )
\ No newline at end of file
+    if config.return_engine == 'polars':
+        delta_nav = db.execute_to_df('SELECT date, client_account_id, ending_value, deposits_withdrawals, dividends FROM delta_nav_new;')
+        calendar = db.execute_to_df('SELECT date FROM calendar_new;')
+
+        lf = tools.all_fund_returns(delta_nav.lazy(), calendar.lazy(), from_date, to_date)
+        db.stage_and_merge(lf, "RELOAD_ALL_FUND_RETURNS", 'dags/sql/all_fund_returns_merge.sql')
+
+    else:
+        db.execute_merge_template_file(
+            file_name='dags/sql/all_fund_returns_materialize.sql',
+            params={'start_date': from_date, 'end_date': to_date}
+        )
\ No newline at end of file
@@ -22,9 +22,9 @@ def fund_return_materializations_daily() -> None:
     db.execute_sql_file('dags/sql/fund_returns_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
+    db.execute_merge_template_file(
         file_name='dags/sql/fund_returns_materialize.sql',
-        params={'start_date': last_market_date, 'end_date': last_market_date}
+        params={'start_date': last_market_date, 'end_date': last_market_date, 'accounts': None}
     )
 
 @task(task_id="fund_return_materializations")
@@ -40,9 +40,9 @@ def fund_return_materializations_backfill(from_date: dt.date, to_date: dt.date)
     db.execute_sql_file('dags/sql/fund_returns_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
+    db.execute_merge_template_file(
         file_name='dags/sql/fund_returns_materialize.sql',
-        params={'start_date': from_date, 'end_date': to_date}
+        params={'start_date': from_date, 'end_date': to_date, 'accounts': None}
     )
 
 @task(task_id="fund_return_materializations")
@@ -61,7 +61,15 @@ def fund_return_materializations_reload() -> None:
     db.execute_sql_file('dags/sql/fund_returns_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
-        file_name='dags/sql/fund_returns_materialize.sql',
-        params={'start_date': from_date, 'end_date': to_date}
-    )
\ No newline at end of file
+    if config.return_engine == 'polars':
+        delta_nav = db.execute_to_df('SELECT date, client_account_id, ending_value, deposits_withdrawals, dividends FROM delta_nav_new;')
+        calendar = db.execute_to_df('SELECT date FROM calendar_new;')
+
+        lf = tools.fund_returns(delta_nav.lazy(), calendar.lazy(), from_date, to_date)
+        db.stage_and_merge(lf, "RELOAD_FUND_RETURNS", 'dags/sql/fund_returns_merge.sql')
+
+    else:
+        db.execute_merge_template_file(
+            file_name='dags/sql/fund_returns_materialize.sql',
+            params={'start_date': from_date, 'end_date': to_date, 'accounts': None}
+        )
\ No newline at end of file
@@ -6,6 +6,25 @@ import os
 from airflow.sdk import task
 import config
 
+def materialize_holding_returns(db: aws.RDS, from_date: dt.date, to_date: dt.date) -> None:
+    """Materialize holding returns between from_date and to_date in month-sized batches.
+
+    Batches run in date order and each commits on its own, so every batch seeds its
+    prior day from the state the previous one carried forward into holding_state.
+    """
+    batch_start = from_date
+
+    while batch_start <= to_date:
+        batch_end = min(to_date, batch_start.replace(day=1) + du.relativedelta(months=1, days=-1))
+
+        db.ensure_month_partitions('holding_returns', batch_start, batch_end)
+        db.execute_merge_template_file(
+            file_name='dags/sql/holding_returns_materialize.sql',
+            params={'start_date': batch_start, 'end_date': batch_end, 'accounts': None, 'carry_state': True}
+        )
+
+        batch_start = batch_end + du.relativedelta(days=1)
+
 @task(task_id="holding_return_materializations")
 def holding_return_materializations_daily() -> None:
     yesterday = dt.date.today() - du.relativedelta(days=1)
@@ -19,13 +38,14 @@ def holding_return_materializations_daily() -> None:
         db_password=os.getenv("DB_PASSWORD"),
         db_port=os.getenv("DB_PORT"),
     )
-    db.execute_sql_file('dags/sql/holding_returns_create.sql')
+    db.create_partitioned_table('dags/sql/holding_returns_create.sql', 'holding_returns', 'date')
+    db.execute_sql_file('dags/sql/holding_state_create.sql')
 
-    # 2. Materialize table
-    db.execute_sql_template_file(
-        file_name='dags/sql/holding_returns_materialize.sql',
-        params={'start_date': last_market_date, 'end_date': last_market_date}
-    )
+    # 2. Materialize table, catching up on any days since the last run
+    last_state_date = db.execute('SELECT MAX(report_date) FROM holding_state;')[0][0]
+    from_date = last_market_date if last_state_date is None else min(last_market_date, last_state_date + du.relativedelta(days=1))
+
+    materialize_holding_returns(db, from_date, last_market_date)
 
 @task(task_id="holding_return_materializations")
 def holding_return_materializations_backfill(from_date: dt.date, to_date: dt.date) -> None:
@@ -37,13 +57,11 @@ def holding_return_materializations_backfill(from_date: dt.date, to_date: dt.dat
         db_password=os.getenv("DB_PASSWORD"),
         db_port=os.getenv("DB_PORT"),
     )
-    db.execute_sql_file('dags/sql/holding_returns_create.sql')
+    db.create_partitioned_table('dags/sql/holding_returns_create.sql', 'holding_returns', 'date')
+    db.execute_sql_file('dags/sql/holding_state_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
-        file_name='dags/sql/holding_returns_materialize.sql',
-        params={'start_date': from_date, 'end_date': to_date}
-    )
+    materialize_holding_returns(db, from_date, to_date)
 
 @task(task_id="holding_return_materializations")
 def holding_return_materializations_reload() -> None:
@@ -58,10 +76,22 @@ def holding_return_materializations_reload() -> None:
         db_password=os.getenv("DB_PASSWORD"),
         db_port=os.getenv("DB_PORT"),
     )
-    db.execute_sql_file('dags/sql/holding_returns_create.sql')
+    db.create_partitioned_table('dags/sql/holding_returns_create.sql', 'holding_returns', 'date')
+    db.execute_sql_file('dags/sql/holding_state_create.sql')
 
     # 2. Materialize table
-    db.execute_sql_template_file(
-        file_name='dags/sql/holding_returns_materialize.sql',
-        params={'start_date': from_date, 'end_date': to_date}
-    )
\ No newline at end of file
+    if config.return_engine == 'polars':
+        positions = db.execute_to_df('SELECT report_date, client_account_id, symbol, sub_category, quantity, mark_price, fx_rate_to_base FROM positions_new;').lazy()
+        trades = db.execute_to_df('SELECT report_date, client_account_id, symbol, sub_category, quantity, trade_price FROM trades_new;').lazy()
+        dividends = db.execute_to_df('SELECT report_date, client_account_id, symbol, sub_category, net_amount, gross_rate FROM dividends_new;').lazy()
+        calendar = db.execute_to_df('SELECT date FROM calendar_new;').lazy()
+
+        lf = tools.holding_returns(positions, trades, dividends, calendar, from_date, to_date)
+        db.stage_and_merge(lf, "RELOAD_HOLDING_RETURNS", 'dags/sql/holding_returns_merge.sql', partition_by=('holding_returns', 'date'))
+
+        # Daily runs seed their prior day from the state as of the end of the reload.
+        state = tools.holding_state(positions, trades, dividends, to_date)
+        db.stage_and_merge(state, "RELOAD_HOLDING_STATE", 'dags/sql/holding_state_merge.sql')
+
+    else:
+        materialize_holding_returns(db, from_date, to_date)
\ No newline at end of file
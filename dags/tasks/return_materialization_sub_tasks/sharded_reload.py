@@ -0,0 +1,122 @@
+import aws
+import datetime as dt
+import dateutil.relativedelta as du
+import os
+import polars as pl
+from airflow.sdk import task, get_current_context
+import config
+
+# Number of shards of each table materialized at once, across workers.
+RETURN_SHARD_CONCURRENCY = int(os.getenv('RETURN_SHARD_CONCURRENCY', 8))
+
+# How each returns table is sharded on reload.
+#   by_account: shards cover one account (otherwise every account, as '*').
+#   params: bind parameters of the materialize script besides the window and accounts.
+RETURN_TABLES = {
+    'holding_returns': {'by_account': True, 'params': {'carry_state': False}},
+    'fund_returns': {'by_account': True, 'params': {}},
+    'all_fund_returns': {'by_account': False, 'params': {}},
+}
+
+def get_db() -> aws.RDS:
+    return aws.RDS(
+        db_endpoint=os.getenv("DB_ENDPOINT"),
+        db_name=os.getenv("DB_NAME"),
+        db_user=os.getenv("DB_USER"),
+        db_password=os.getenv("DB_PASSWORD"),
+        db_port=os.getenv("DB_PORT"),
+    )
+
+@task
+def plan_return_shards(table_name: str) -> list[dict[str, str]]:
+    """Record the (account, month) shards of a reload and return those not done yet.
+
+    Shards are recorded in materialization_progress under the Airflow run id, so
+    clearing and rerunning a reload only materializes the shards that did not finish.
+    """
+    from_date = config.min_date
+    to_date = dt.date.today()
+    run_id = get_current_context()['run_id']
+
+    # 1. Create core and progress tables if not exists
+    db = get_db()
+    if table_name == 'holding_returns':
+        db.create_partitioned_table('dags/sql/holding_returns_create.sql', 'holding_returns', 'date')
+        db.execute_sql_file('dags/sql/holding_state_create.sql')
+
+        # Shards run concurrently, so their partitions are created up front.
+        db.ensure_month_partitions('holding_returns', from_date, to_date)
+    else:
+        db.execute_sql_file(f'dags/sql/{table_name}_create.sql')
+
+    db.execute_sql_file('dags/sql/materialization_progress_create.sql')
+
+    # 2. Record every month each account has data in as a pending shard
+    rows = db.execute_sql_template_file(f'dags/sql/{table_name}_shards.sql', params={'start_date': from_date, 'end_date': to_date})
+    shards = pl.DataFrame(rows, schema={'client_account_id': pl.String, 'month': pl.Date}, orient='row').with_columns(
+        run_id=pl.lit(run_id),
+        table_name=pl.lit(table_name),
+    )
+    db.stage_and_merge(shards, f"{table_name.upper()}_SHARDS", 'dags/sql/materialization_progress_merge.sql')
+
+    # 3. Return the shards still to run
+    rows = db.execute_sql_template_file('dags/sql/materialization_progress_pending.sql', params={'run_id': run_id, 'table_name': table_name})
+
+    return [{'client_account_id': client_account_id, 'month': month.isoformat()} for client_account_id, month in rows]
+
+@task
+def materialize_return_shard(table_name: str, shard: dict[str, str]) -> None:
+    """Materialize one (account, month) shard of a returns table.
+
+    The materialize scripts read the rows before the month that the first day lags
+    against, so shards are independent of each other and can run in any order.
+    """
+    month = dt.date.fromisoformat(shard['month'])
+    from_date = max(month, config.min_date)
+    to_date = min(month + du.relativedelta(months=1, days=-1), dt.date.today())
+
+    progress = {
+        'run_id': get_current_context()['run_id'],
+        'table_name': table_name,
+        'client_account_id': shard['client_account_id'],
+        'month': month,
+        'inserted': None,
+        'updated': None,
+        'unchanged': None,
+    }
+
+    params = {'start_date': from_date, 'end_date': to_date, **RETURN_TABLES[table_name]['params']}
+    if RETURN_TABLES[table_name]['by_account']:
+        params['accounts'] = [shard['client_account_id']]
+
+    # 1. Mark shard as running
+    db = get_db()
+    db.execute_sql_template_file('dags/sql/materialization_progress_update.sql', params={**progress, 'status': 'running'})
+
+    # 2. Materialize shard
+    try:
+        counts = db.execute_merge_template_file(file_name=f'dags/sql/{table_name}_materialize.sql', params=params)
+
+    except Exception:
+        db.execute_sql_template_file('dags/sql/materialization_progress_update.sql', params={**progress, 'status': 'failed'})
+        raise
+
+    # 3. Mark shard as done
+    db.execute_sql_template_file('dags/sql/materialization_progress_update.sql', params={**progress, **counts, 'status': 'done'})
+
+@task(task_id="holding_state_refresh")
+def refresh_holding_state() -> None:
+    """Rebuild holding_state after a sharded reload, which does not carry it forward."""
+    db = get_db()
+    db.execute_merge_template_file(file_name='dags/sql/holding_state_refresh.sql', params={'end_date': dt.date.today()})
+
+def sharded_reload(table_name: str):
+    """Plan the shards of a returns table and materialize them as mapped tasks."""
+    shards = plan_return_shards.override(task_id=f"{table_name}_shards")(table_name)
+
+    return (
+        materialize_return_shard
+        .override(task_id=f"{table_name}_materializations", max_active_tis_per_dagrun=RETURN_SHARD_CONCURRENCY)
+        .partial(table_name=table_name)
+        .expand(shard=shards)
+    )
@@ -1,5 +1,6 @@
 import datetime as dt
 from airflow.sdk import task_group
+import config
 from tasks.return_materialization_sub_tasks.holding_returns_task import (
     holding_return_materializations_daily,
     holding_return_materializations_backfill,
@@ -15,6 +16,7 @@ from tasks.return_materialization_sub_tasks.all_fund_returns_task import (
     all_fund_return_materializations_backfill,
     all_fund_return_materializations_reload,
 )
+from tasks.return_materialization_sub_tasks.sharded_reload import refresh_holding_state, sharded_reload
 
 
 @task_group(group_id="return_materializations")
@@ -33,6 +35,13 @@ def return_materializations_backfill(from_date: dt.date, to_date: dt.date):
 
 @task_group(group_id="return_materializations")
 def return_materializations_reload():
-    holding_return_materializations_reload()
-    fund_return_materializations_reload()
-    all_fund_return_materializations_reload()
+    if config.return_engine == 'polars':
+        holding_return_materializations_reload()
+        fund_return_materializations_reload()
+        all_fund_return_materializations_reload()
+
+    else:
+        # Each table is sharded by (account, month) and its shards run concurrently.
+        sharded_reload('holding_returns') >> refresh_holding_state()
+        sharded_reload('fund_returns')
+        sharded_reload('all_fund_returns')
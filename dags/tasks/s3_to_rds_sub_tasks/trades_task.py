@@ -4,13 +4,13 @@ import datetime as dt
 import dateutil.relativedelta as du
 import os
 import polars as pl
-import fsspec
 import dotenv
 from airflow.sdk import task
+from tasks.partitions import dedupe, list_legacy_files, scan_legacy_files, scan_partitions
 
 dotenv.load_dotenv(override=True)
 
-def clean_trades_data(df: pl.DataFrame) -> pl.DataFrame:
+def clean_trades_data(lf: pl.LazyFrame) -> pl.LazyFrame:
     trades_column_mapping = {
         'ReportDate': 'report_date',
         'ClientAccountID': 'client_account_id',
@@ -44,7 +44,7 @@ def clean_trades_data(df: pl.DataFrame) -> pl.DataFrame:
     }
 
     return (
-        df
+        lf
         .filter(pl.col('ClientAccountID').ne('ClientAccountID'))
         .select(trades_column_mapping.keys())
         .rename(trades_column_mapping)
@@ -62,24 +62,8 @@ def trades_transform_and_load_daily():
     yesterday = dt.date.today() - du.relativedelta(days=1)
     last_market_date = tools.get_last_market_date(reference_date=yesterday)
 
-    # 1. Process raw positions data
-    source_pattern = f"s3://ibkr-flex-query-files/daily-files/{last_market_date}/*/*-trades.csv"
-
-    storage_options = {
-        "key": os.getenv('COGNITO_ACCESS_KEY_ID'),
-        "secret": os.getenv('COGNITO_SECRET_ACCESS_KEY'),
-    }
-
-    fs = fsspec.filesystem("s3", **storage_options)
-    file_list = fs.glob(source_pattern)
-
-    dfs = []
-    for file in file_list:
-        df = pl.read_csv(f"s3://{file}", storage_options=storage_options, infer_schema_length=10000)
-        df_clean = clean_trades_data(df)
-        dfs.append(df_clean)
-
-    df = pl.concat(dfs)
+    # 1. Read trades data from the landed partitions
+    df = scan_partitions('trades', from_date=last_market_date, to_date=last_market_date).collect()
 
     # 2. Create core table if not exists
     db = aws.RDS(
@@ -89,38 +73,16 @@ def trades_transform_and_load_daily():
         db_password=os.getenv("DB_PASSWORD"),
         db_port=os.getenv("DB_PORT"),
     )
-    db.execute_sql_file('dags/sql/trades_create.sql')
+    db.create_partitioned_table('dags/sql/trades_create.sql', 'trades_new', 'report_date')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{last_market_date}_TRADES"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/trades_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
+    db.stage_and_merge(df, stage_table, 'dags/sql/trades_merge.sql', partition_by=('trades_new', 'report_date'))
 
 @task(task_id="trades_transform_and_load")
 def trades_transform_and_load_backfill(from_date: dt.date, to_date: dt.date):
-    # 1. Process raw positions data
-    source_pattern = f"s3://ibkr-flex-query-files/backfill-files/{from_date}_{to_date}/*/*-trades.csv"
-
-    storage_options = {
-        "key": os.getenv('COGNITO_ACCESS_KEY_ID'),
-        "secret": os.getenv('COGNITO_SECRET_ACCESS_KEY'),
-    }\
-
-    fs = fsspec.filesystem("s3", **storage_options)
-    file_list = fs.glob(source_pattern)
-
-    dfs = []
-    for file in file_list:
-        df = pl.read_csv(f"s3://{file}", storage_options=storage_options, infer_schema_length=10000)
-        df_clean = clean_trades_data(df)
-        dfs.append(df_clean)
-
-    df = pl.concat(dfs)
+    # 1. Read trades data from the landed partitions
+    lf = scan_partitions('trades', from_date=from_date, to_date=to_date)
 
     # 2. Create core table if not exists
     db = aws.RDS(
@@ -130,49 +92,19 @@ def trades_transform_and_load_backfill(from_date: dt.date, to_date: dt.date):
         db_password=os.getenv("DB_PASSWORD"),
         db_port=os.getenv("DB_PORT"),
     )
-    db.execute_sql_file('dags/sql/trades_create.sql')
+    db.create_partitioned_table('dags/sql/trades_create.sql', 'trades_new', 'report_date')
 
-    # 3. Load into stage table
+    # 3. Stage and merge into core table
     stage_table = f"{from_date}_{to_date}_TRADES"
-    db.stage_dataframe(df, stage_table)
-
-    # 4. Merge into core table
-    db.execute_sql_template_file('dags/sql/trades_merge.sql', params={'stage_table': stage_table})
-
-    # 5. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
+    db.stage_and_merge(lf, stage_table, 'dags/sql/trades_merge.sql', partition_by=('trades_new', 'report_date'))
 
 @task(task_id="trades_transform_and_load")
 def trades_transform_and_load_reload():
-    # 1. Get all files in S3
-    storage_options = {
-        "key": os.getenv('COGNITO_ACCESS_KEY_ID'),
-        "secret": os.getenv('COGNITO_SECRET_ACCESS_KEY'),
-    }
-
-    def get_file_list(source_pattern: str) -> list[str]:
-        fs = fsspec.filesystem("s3", **storage_options)
-        return fs.glob(source_pattern)
-
-    history_pattern = "s3://ibkr-flex-query-files/history-files/*/*trades*.csv"
-    history_files = get_file_list(history_pattern)
-
-    backfill_pattern = "s3://ibkr-flex-query-files/backfill-files/*/*/*trades.csv"
-    backfill_files = get_file_list(backfill_pattern)
+    # 1. Get legacy files in S3 that have not been compacted yet
+    file_list = list_legacy_files('trades')
 
-    daily_pattern = "s3://ibkr-flex-query-files/daily-files/*/*/*trades.csv"
-    daily_files = get_file_list(daily_pattern)
-
-    file_list = history_files + backfill_files + daily_files
-
-    # 2. Read, clean, and concatenate files
-    dfs = []
-    for file in file_list:
-        df = pl.read_csv(f"s3://{file}", storage_options=storage_options, infer_schema_length=10000)
-        df_clean = clean_trades_data(df)
-        dfs.append(df_clean)
-
-    df = pl.concat(dfs).unique()
+    # 2. Plan reading, cleaning, and concatenating files, oldest first (partitioned files are already clean)
+    lf = dedupe(pl.concat(scan_legacy_files(file_list, 'trades', clean_trades_data) + [scan_partitions('trades')]), 'trades')
 
     # 3. Create core table if not exists
     db = aws.RDS(
@@ -182,14 +114,8 @@ def trades_transform_and_load_reload():
         db_password=os.getenv("DB_PASSWORD"),
         db_port=os.getenv("DB_PORT"),
     )
-    db.execute_sql_file('dags/sql/trades_create.sql')
+    db.create_partitioned_table('dags/sql/trades_create.sql', 'trades_new', 'report_date')
 
-    # 4. Load into stage table
+    # 4. Stage and merge into core table
     stage_table = "RELOAD_TRADES"
-    db.stage_dataframe(df, stage_table)
-
-    # 5. Merge into core table
-    db.execute_sql_template_file('dags/sql/trades_merge.sql', params={'stage_table': stage_table})
-
-    # 6. Drop stage table
-    db.execute(f'DROP TABLE "{stage_table}";')
+    db.stage_and_merge(lf, stage_table, 'dags/sql/trades_merge.sql', partition_by=('trades_new', 'report_date'))
@@ -0,0 +1,42 @@
+from .ibkr import ibkr_query, ibkr_query_stream, ibkr_query_batches, validate_backfill_dates
+from .flex_sections import route_flex_sections
+from .flex_schemas import SOURCE_SCHEMAS
+from .spool import spool_chunks
+from .ibkr_async import FlexJob, ibkr_query_many, ibkr_query_many_async, read_flex_csv
+from .polling import FlexReportTooLongError, FlexTimeoutError, PollingStrategy
+from .cache import FlexCache, default_cache
+from .http_client import get_session, get_async_client
+from .chunking import ChunkPlanner, default_planner
+from .returns import holding_returns, holding_state, fund_returns, all_fund_returns
+from .market_calendar import TradingCalendar, get_trading_calendar, get_market_calendar_df, get_last_market_date
+
+__all__ = [
+    'ibkr_query',
+    'ibkr_query_stream',
+    'route_flex_sections',
+    'SOURCE_SCHEMAS',
+    'spool_chunks',
+    'ibkr_query_batches',
+    'validate_backfill_dates',
+    'FlexJob',
+    'ibkr_query_many',
+    'ibkr_query_many_async',
+    'read_flex_csv',
+    'FlexReportTooLongError',
+    'FlexTimeoutError',
+    'PollingStrategy',
+    'FlexCache',
+    'default_cache',
+    'get_session',
+    'get_async_client',
+    'ChunkPlanner',
+    'default_planner',
+    'TradingCalendar',
+    'get_trading_calendar',
+    'get_market_calendar_df',
+    'get_last_market_date',
+    'holding_returns',
+    'holding_state',
+    'fund_returns',
+    'all_fund_returns',
+]
\ No newline at end of file
@@ -0,0 +1,136 @@
+import datetime as dt
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from typing import IO, Iterable, Iterator
+from tools.settings import STATE_DIR
+
+# Prefix of entries that are still being written.
+PARTIAL_PREFIX = '.partial-'
+
+class FlexCache:
+    """On-disk cache of raw Flex statements.
+
+    Entries are keyed by a hash of (query_id, from_date, to_date, flex_version) and hold
+    the statement bytes exactly as IBKR returned them. Statements that end before the
+    current month are closed and never expire. Statements touching the current month
+    expire after `ttl` seconds so recent data is re-fetched. Once the cache grows past
+    `max_bytes`, the least recently used entries are evicted.
+
+    Args:
+        directory (str): Directory the cache lives in.
+        max_bytes (int): Maximum total size of the cache.
+        ttl (float): Seconds before an entry for the current month expires.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _path(self, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int) -> str:
+        key = f"{query_id}|{from_date.isoformat()}|{to_date.isoformat()}|{flex_version}"
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _is_closed(self, to_date: dt.date) -> bool:
+        return to_date < dt.date.today().replace(day=1)
+
+    def get(self, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int) -> IO[bytes] | None:
+        """Open the cached statement for reading, or return None on a miss."""
+        path = self._path(query_id, from_date, to_date, flex_version)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        # The modification time is when the entry was written, the access time when it was last used.
+        if not self._is_closed(to_date) and time.time() - stat.st_mtime > self.ttl:
+            os.remove(path)
+            return None
+
+        os.utime(path, (time.time(), stat.st_mtime))
+        return open(path, 'rb')
+
+    def contains(self, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int) -> bool:
+        """Whether a statement is cached and not expired, without touching its access time."""
+        path = self._path(query_id, from_date, to_date, flex_version)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+
+        return self._is_closed(to_date) or time.time() - stat.st_mtime <= self.ttl
+
+    def put(self, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int, file: IO[bytes]) -> None:
+        """Copy a statement file into the cache. The file is left positioned at its end."""
+        for _ in self.put_chunks(query_id, from_date, to_date, flex_version, iter(lambda: file.read(1024 * 1024), b"")):
+            pass
+
+    def put_chunks(self, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Write a statement into the cache while passing its chunks through.
+
+        The entry only becomes visible once every chunk has been written, so an
+        interrupted download never leaves a truncated statement behind.
+        """
+        path = self._path(query_id, from_date, to_date, flex_version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=PARTIAL_PREFIX, delete=False) as temp_file:
+            try:
+                for chunk in chunks:
+                    temp_file.write(chunk)
+                    yield chunk
+
+            except BaseException:
+                temp_file.close()
+                os.remove(temp_file.name)
+                raise
+
+        os.replace(temp_file.name, path)
+
+        now = time.time()
+        os.utime(path, (now, now))
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                if file_name.startswith(PARTIAL_PREFIX):
+                    continue
+
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total_bytes -= size
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+default_cache = FlexCache(
+    directory=os.getenv('IBKR_CACHE_DIR', os.path.join(STATE_DIR, 'cache')),
+    max_bytes=int(os.getenv('IBKR_CACHE_MAX_BYTES', 2 * 1024 ** 3)),
+    ttl=float(os.getenv('IBKR_CACHE_TTL', 6 * 60 * 60)),
+)
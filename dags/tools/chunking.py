@@ -0,0 +1,171 @@
+import os
+import datetime as dt
+from typing import Callable
+from tools.settings import STATE_DIR, load_state, save_state
+from tools.market_calendar import get_trading_calendar
+
+# Window widths, in months. Each divides the wider ones, so windows of any width nest on one calendar grid.
+WINDOW_MONTHS = (12, 6, 3, 1)
+
+# Trading days in a typical month, used to size a window of a given width.
+TRADING_DAYS_PER_MONTH = 21
+
+def _month_index(date: dt.date) -> int:
+    return date.year * 12 + date.month - 1
+
+class ChunkPlanner:
+    """Adaptive date windows for pulling Flex Query statements in batches.
+
+    Learns, per query id, how many rows IBKR returns per trading day and how many
+    seconds each row adds to report generation. Each query gets the widest window in
+    `WINDOW_MONTHS` whose predicted generation time stays under `target_seconds`, so
+    cheap queries like delta NAV are pulled in a few wide requests while heavy ones
+    stay at a month. Windows that time out are split in half and retried.
+
+    Windows are aligned to a fixed calendar grid (a 3 month window always covers a
+    quarter), so reruns produce the same windows and hit the statement cache.
+
+    Args:
+        target_seconds (float): Generation time a single window should aim for.
+        overhead_seconds (float): Fixed generation time of any statement, regardless of size.
+        max_months (int): Widest window allowed, in months.
+        smoothing (float): Weight given to each new observation in the running averages.
+        path (str): JSON file the statistics are persisted to. Nothing is persisted if None.
+    """
+
+    def __init__(
+        self,
+        target_seconds: float = 60.0,
+        overhead_seconds: float = 5.0,
+        max_months: int = 12,
+        smoothing: float = 0.3,
+        path: str = None,
+    ) -> None:
+        self.target_seconds = target_seconds
+        self.overhead_seconds = overhead_seconds
+        self.max_months = max_months
+        self.smoothing = smoothing
+        self.path = path
+        self.stats: dict[str, dict[str, float]] = load_state(path)
+
+    def _update(self, query_id: str, rows_per_day: float, seconds_per_row: float) -> None:
+        stats = self.stats.get(str(query_id))
+
+        if stats is None:
+            self.stats[str(query_id)] = {'rows_per_day': rows_per_day, 'seconds_per_row': seconds_per_row}
+
+        else:
+            stats['rows_per_day'] += self.smoothing * (rows_per_day - stats['rows_per_day'])
+            stats['seconds_per_row'] += self.smoothing * (seconds_per_row - stats['seconds_per_row'])
+
+        save_state(self.path, self.stats)
+
+    def record(self, query_id: str, from_date: dt.date, to_date: dt.date, seconds: float, rows: int) -> None:
+        """Record how long a statement covering from_date to to_date took to generate."""
+        trading_days = max(len(get_trading_calendar().get_trading_days(from_date, to_date)), 1)
+        rows = max(rows, 1)
+
+        self._update(query_id, rows / trading_days, max(seconds - self.overhead_seconds, 0) / rows)
+
+    def record_timeout(self, query_id: str, from_date: dt.date, to_date: dt.date, deadline: float) -> None:
+        """Record a window that was not generated within the deadline."""
+        stats = self.stats.get(str(query_id))
+
+        if stats is None:
+            return
+
+        trading_days = max(len(get_trading_calendar().get_trading_days(from_date, to_date)), 1)
+        rows = max(stats['rows_per_day'] * trading_days, 1)
+
+        self._update(query_id, stats['rows_per_day'], deadline / rows)
+
+    def predict_seconds(self, query_id: str, trading_days: int) -> float | None:
+        stats = self.stats.get(str(query_id))
+
+        if stats is None:
+            return None
+
+        return self.overhead_seconds + stats['rows_per_day'] * trading_days * stats['seconds_per_row']
+
+    def window_months(self, query_id: str) -> int:
+        """Widest window, in months, predicted to generate within the target for this query."""
+        for months in WINDOW_MONTHS:
+            if months > self.max_months:
+                continue
+
+            predicted = self.predict_seconds(query_id, months * TRADING_DAYS_PER_MONTH)
+
+            # Queries with no history start at one month per window.
+            if predicted is not None and predicted <= self.target_seconds:
+                return months
+
+        return 1
+
+    def plan(
+        self,
+        query_id: str,
+        from_date: dt.date,
+        to_date: dt.date,
+        is_cached: Callable[[dt.date, dt.date], bool] = None,
+    ) -> list[tuple[dt.date, dt.date]]:
+        """Split from_date to to_date into windows of whole months sized for this query.
+
+        Args:
+            query_id (str): ID from IBKR flex query dashboard.
+            from_date (dt.date): Date from which to start the query.
+            to_date (dt.date): Date from which to end the query.
+            is_cached (Callable[[dt.date, dt.date], bool]): Whether a window is already cached.
+                A cached window of any width on the grid is reused before the statistics are
+                consulted, so changes in the statistics between runs do not re-pull it.
+        """
+        calendar = get_trading_calendar()
+        months = calendar.month_intervals(from_date, to_date)
+        widths = [width for width in WINDOW_MONTHS if width <= self.max_months]
+        width = self.window_months(query_id)
+
+        def grid_window(width: int) -> int:
+            # Number of leading months in the same grid cell as the first one.
+            cell = _month_index(months[0][0]) // width
+            return sum(1 for start, _ in months if _month_index(start) // width == cell)
+
+        windows = []
+        while months:
+            count = grid_window(width)
+
+            if is_cached is not None:
+                for cached_width in widths:
+                    cached_count = grid_window(cached_width)
+                    if is_cached(months[0][0], months[cached_count - 1][1]):
+                        count = cached_count
+                        break
+
+            windows.append((months[0][0], months[count - 1][1]))
+            months = months[count:]
+
+        return windows
+
+    def split(self, from_date: dt.date, to_date: dt.date) -> list[tuple[dt.date, dt.date]]:
+        """Split a window in half, along month boundaries when it spans several months.
+
+        Returns the window unchanged when it is a single trading day.
+        """
+        calendar = get_trading_calendar()
+        months = calendar.month_intervals(from_date, to_date)
+
+        if len(months) > 1:
+            half = len(months) // 2
+            return [(months[0][0], months[half - 1][1]), (months[half][0], months[-1][1])]
+
+        trading_days = calendar.get_trading_days(from_date, to_date)
+
+        if len(trading_days) < 2:
+            return [(from_date, to_date)]
+
+        half = len(trading_days) // 2
+        return [(trading_days[0], trading_days[half - 1]), (trading_days[half], trading_days[-1])]
+
+
+default_planner = ChunkPlanner(
+    target_seconds=float(os.getenv('IBKR_CHUNK_TARGET_SECONDS', 60)),
+    path=os.path.join(STATE_DIR, 'chunking.json'),
+)
@@ -0,0 +1,62 @@
+import polars as pl
+
+# Source columns each dataset needs from a Flex CSV, and the dtype to parse each as.
+# Dates arrive as YYYYMMDD and are read as strings, then parsed by the clean_* functions.
+SOURCE_SCHEMAS = {
+    'positions': {
+        'ReportDate': pl.String,
+        'ClientAccountID': pl.String,
+        'AssetClass': pl.String,
+        'SubCategory': pl.String,
+        'Description': pl.String,
+        'CUSIP': pl.String,
+        'ISIN': pl.String,
+        'Symbol': pl.String,
+        'MarkPrice': pl.Float64,
+        'Quantity': pl.Float64,
+        'FXRateToBase': pl.Float64,
+    },
+    'trades': {
+        'ReportDate': pl.String,
+        'ClientAccountID': pl.String,
+        'AssetClass': pl.String,
+        'SubCategory': pl.String,
+        'Description': pl.String,
+        'CUSIP': pl.String,
+        'ISIN': pl.String,
+        'Symbol': pl.String,
+        'TradeID': pl.String,
+        'Quantity': pl.Float64,
+        'TradePrice': pl.Float64,
+        'IBCommission': pl.Float64,
+        'Buy/Sell': pl.String,
+    },
+    'dividends': {
+        'ReportDate': pl.String,
+        'ClientAccountID': pl.String,
+        'AssetClass': pl.String,
+        'SubCategory': pl.String,
+        'Description': pl.String,
+        'CUSIP': pl.String,
+        'ISIN': pl.String,
+        'Symbol': pl.String,
+        'ActionID': pl.String,
+        'ExDate': pl.String,
+        'PayDate': pl.String,
+        'Quantity': pl.Float64,
+        'GrossRate': pl.Float64,
+        'GrossAmount': pl.Float64,
+        'Tax': pl.Float64,
+        'Fee': pl.Float64,
+        'NetAmount': pl.Float64,
+    },
+    'delta_nav': {
+        'FromDate': pl.String,
+        'ToDate': pl.String,
+        'ClientAccountID': pl.String,
+        'StartingValue': pl.Float64,
+        'EndingValue': pl.Float64,
+        'DepositsWithdrawals': pl.Float64,
+        'Dividends': pl.Float64,
+    },
+}
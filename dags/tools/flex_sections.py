@@ -0,0 +1,76 @@
+import csv
+import tempfile
+from typing import IO, Iterable
+from tools.spool import SPOOL_MAX_SIZE
+
+# A column that only appears in the header row of each dataset's section.
+SECTION_MARKERS = {
+    'positions': 'MarkPrice',
+    'trades': 'TradeID',
+    'dividends': 'ActionID',
+    'delta_nav': 'StartingValue',
+}
+
+# Header and trailer records IBKR can wrap statements and sections in.
+RECORD_MARKERS = ('"BOF"', '"EOF"', '"BOS"', '"EOS"', 'BOF,', 'EOF,', 'BOS,', 'EOS,')
+
+def _detect_section(header: list[str]) -> str:
+    matches = [dataset for dataset, marker in SECTION_MARKERS.items() if marker in header]
+
+    if len(matches) != 1:
+        raise Exception("Unable to identify statement section from header:", header)
+
+    return matches[0]
+
+def route_flex_sections(lines: Iterable[str]) -> dict[str, IO[bytes]]:
+    """Route the lines of a multi-section Flex statement to one CSV file per dataset.
+
+    A combined Flex query returns the positions, trades, dividends and delta NAV
+    sections back to back in a single CSV, each starting with its own header row.
+    Header rows are found by their `ClientAccountID` column and routed by the
+    columns they contain. Header rows repeated within a section (one per account)
+    are dropped. Lines are streamed into spooled temporary files, so statements
+    of any size can be split without holding them in memory.
+
+    Args:
+        lines (Iterable[str]): Lines of the CSV statement returned by the GetStatement endpoint.
+
+    Returns:
+        dict[str, IO[bytes]]: CSV file for each section found, rewound to the start.
+    """
+    headers: dict[str, str] = {}
+    files: dict[str, IO[bytes]] = {}
+    file = None
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        if not line or line.startswith(RECORD_MARKERS):
+            continue
+
+        if 'ClientAccountID' in line:
+            header = next(csv.reader([line]))
+
+            if 'ClientAccountID' in header:
+                dataset = _detect_section(header)
+
+                if dataset not in files:
+                    headers[dataset] = line
+                    files[dataset] = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+                    files[dataset].write(line.encode('utf-8') + b"\n")
+
+                elif headers[dataset] != line:
+                    raise Exception("Statement has conflicting headers for section:", dataset)
+
+                file = files[dataset]
+                continue
+
+        if file is None:
+            raise Exception("Statement data found before a section header.")
+
+        file.write(line.encode('utf-8') + b"\n")
+
+    for file in files.values():
+        file.seek(0)
+
+    return files
@@ -0,0 +1,81 @@
+import asyncio
+import functools
+import os
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Transport settings shared by every call to the IBKR Flex Web Service.
+RETRIES = int(os.getenv('IBKR_HTTP_RETRIES', 3))
+BACKOFF_FACTOR = float(os.getenv('IBKR_HTTP_BACKOFF', 1.0))
+CONNECT_TIMEOUT = float(os.getenv('IBKR_HTTP_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(os.getenv('IBKR_HTTP_READ_TIMEOUT', 60))
+POOL_SIZE = int(os.getenv('IBKR_HTTP_POOL_SIZE', 16))
+RETRY_STATUSES = (500, 502, 503, 504)
+
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+@functools.cache
+def get_session() -> requests.Session:
+    """Process-wide HTTP session with keep-alive connection pooling and retries.
+
+    Reusing the session means a DAG run pays for the TLS handshake with IBKR once
+    per connection instead of once per request. GET requests are retried with
+    exponential backoff on connection resets and 5xx responses.
+    """
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """Async transport that retries on connection errors and 5xx responses with backoff."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, retries: int = RETRIES, backoff_factor: float = BACKOFF_FACTOR) -> None:
+        self.transport = transport
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+
+            try:
+                response = await self.transport.handle_async_request(request)
+
+            except (httpx.ConnectError, httpx.ReadError, httpx.RemoteProtocolError):
+                if last_attempt:
+                    raise
+
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+
+                await response.aclose()
+
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def get_async_client(max_connections: int = POOL_SIZE) -> httpx.AsyncClient:
+    """Async HTTP client with keep-alive connection pooling, timeouts and retries."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    # RetryTransport already retries connection errors, so the inner transport does not.
+    transport = RetryTransport(httpx.AsyncHTTPTransport(limits=limits))
+    timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+    return httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
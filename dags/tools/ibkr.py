@@ -0,0 +1,196 @@
+import functools
+import itertools
+import time
+import xml.etree.ElementTree as ET
+import polars as pl
+import datetime as dt
+from typing import Iterator
+import dateutil.relativedelta as du
+from tools.chunking import default_planner
+from tools.http_client import TIMEOUT, get_session
+from tools.cache import FlexCache, default_cache
+from tools.polling import FlexTimeoutError, PollingStrategy, default_polling
+from tools.spool import CHUNK_SIZE, spool_chunks
+from tools.ibkr_async import FLEX_BASE_URL, FlexJob, ibkr_query_many, read_flex_csv
+
+def ibkr_query_stream(token: int, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int = 3, polling: PollingStrategy = default_polling, chunk_size: int = CHUNK_SIZE, cache: FlexCache | None = default_cache) -> Iterator[bytes]:
+    """Function for streaming the raw CSV statement from IBKR.
+
+    The statement body is yielded in chunks as it is downloaded, so it
+    can be written to storage without ever being held in memory.
+    Statements found in the local cache are served without calling IBKR.
+
+    Args:
+        token (int): Token from IBKR flex query dashboard (expires annualy).
+        query_id (str): ID from IBKR flex query dashboard.
+        from_Date (dt.date): Date from which to start the query.
+        to_date (dt.date): Date from which to end the query.
+        flex_version (int): Version of Flex Query Service to use (we use version 3).
+        polling (PollingStrategy): Schedule for polling GetStatement while the report generates.
+        chunk_size (int): Number of bytes per yielded chunk.
+        cache (FlexCache): Local cache of raw statements. Pass None to always call IBKR.
+    """
+    cache_key = (query_id, from_date, to_date, flex_version)
+
+    if cache is not None:
+        cached_file = cache.get(*cache_key)
+
+        if cached_file is not None:
+            with cached_file:
+                yield from iter(lambda: cached_file.read(chunk_size), b"")
+            return
+
+    from_date = from_date.strftime("%Y%m%d")
+    to_date = to_date.strftime("%Y%m%d")
+
+    # Step 1: get reference code from SendRequest endpoint
+    request_base = FLEX_BASE_URL
+    session = get_session()
+
+    send_slug = "/SendRequest"
+    send_params = {
+        "t": token, 
+        "q": query_id, 
+        "v": flex_version,
+        "fd": from_date,
+        "td": to_date
+    }
+
+    send_response = session.get(url=request_base+send_slug, params=send_params, timeout=TIMEOUT)
+
+    # Validate http status code
+    if send_response.status_code != 200:
+        raise Exception("Failed to send request:", send_response.text)
+
+    # Parse XML
+    tree = ET.ElementTree(ET.fromstring(send_response.text))
+    root = tree.getroot()
+
+    # Validate XML status and get reference code
+    status = root.findtext('Status')
+    if status != 'Success':
+        error_code = root.findtext('ErrorCode')
+        error_message = root.findtext('ErrorMessage')
+        print(send_params)
+        print(send_response.text)
+        raise Exception("Failed to send request:", error_code, error_message)
+
+    reference_code = root.findtext('ReferenceCode')
+    sent_at = time.monotonic()
+
+    # Step 2: get statement from GetStatement endpoint
+
+    receive_slug = "/GetStatement"
+    receive_params = {
+        "t": token, 
+        "q": reference_code, 
+        "v": flex_version,
+        "fd": from_date,
+        "td": to_date
+    }
+
+    # Poll until the report is done generating, backing off between polls.
+    for wait in polling.waits(query_id):
+        if time.monotonic() + wait - sent_at > polling.deadline:
+            raise FlexTimeoutError(f"Statement for query {query_id} ({from_date}-{to_date}) not generated within {polling.deadline} seconds.")
+
+        time.sleep(wait)
+
+        with session.get(url=request_base+receive_slug, params=receive_params, allow_redirects=True, stream=True, timeout=TIMEOUT) as receive_response:
+
+            if receive_response.status_code != 200:
+                raise Exception("Failed to send request:", receive_response.text)
+
+            chunks = receive_response.iter_content(chunk_size=chunk_size)
+            first_chunk = next(chunks, b"")
+
+            # CSV response
+            if not first_chunk.startswith(b"<"):
+                polling.record(query_id, time.monotonic() - sent_at)
+                statement = itertools.chain([first_chunk], chunks)
+
+                if cache is not None:
+                    statement = cache.put_chunks(*cache_key, statement)
+
+                yield from statement
+                return
+
+            # XML response
+            body = first_chunk + b"".join(chunks)
+
+        tree = ET.ElementTree(ET.fromstring(body))
+        root = tree.getroot()
+        
+        error_code = root.findtext("ErrorCode")
+        error_message = root.findtext("ErrorMessage")
+
+        match error_code:
+
+            case "1019" | "1021":
+                print(f"{error_code} status code. Report still generating.")
+
+            case _:
+                raise Exception("Failed to send request:", error_code, error_message)
+
+def ibkr_query(token: int, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int = 3, polling: PollingStrategy = default_polling, cache: FlexCache | None = default_cache) -> pl.DataFrame:
+    """Function for pulling data from IBKR.
+
+    Args:
+        token (int): Token from IBKR flex query dashboard (expires annualy).
+        query_id (str): ID from IBKR flex query dashboard.
+        from_Date (dt.date): Date from which to start the query.
+        to_date (dt.date): Date from which to end the query.
+        flex_version (int): Version of Flex Query Service to use (we use version 3).
+        polling (PollingStrategy): Schedule for polling GetStatement while the report generates.
+        cache (FlexCache): Local cache of raw statements. Pass None to always call IBKR.
+    """
+    with spool_chunks(ibkr_query_stream(token, query_id, from_date, to_date, flex_version, polling, cache=cache)) as file:
+
+        # Parse results as polars dataframe  
+        df = read_flex_csv(file)
+
+    return df
+
+def validate_backfill_dates(from_date: dt.date, to_date: dt.date) -> None:
+    """Raise if the date range falls outside of what the Flex Web Service can return.
+
+    IBKR allows for pulling data from up to a year ago and up to yesterday.
+    """
+    min_start_date = dt.date.today() - du.relativedelta(years=1)
+    min_start_date = min_start_date.replace(day=1) + du.relativedelta(months=1)
+
+    if from_date < min_start_date:
+        raise Exception(f"Invalid start date: {from_date}. Must be greater than or equal to {min_start_date}.")
+    
+    max_end_date = dt.date.today() - du.relativedelta(days=1)
+
+    if to_date > max_end_date:
+        raise Exception(f"Invalid end date: {to_date}. Must be less than or equal to {max_end_date}")
+
+def ibkr_query_batches(token: int, query_id: str, from_date: dt.date, to_date: dt.date, flex_version: int = 3) -> pl.DataFrame:
+    """Function for pulling data from IBKR in batches.
+    
+    IBKR allows for pulling data from up to a year ago.
+    Due to the slowness of IBKR to generate year long reports,
+    we chunk our API requests into windows of whole months sized
+    by the `ChunkPlanner` from how long this query has taken before,
+    and pull them concurrently with `ibkr_query_many`.
+
+    IBKR Docs: https://www.ibkrguides.com/clientportal/performanceandstatements/flex3.htm
+
+    Args:
+        token (int): Token from IBKR flex query dashboard (expires annualy).
+        query_id (str): ID from IBKR flex query dashboard.
+        from_date (dt.date): Date from which to start the query.
+        to_date (dt.date): Date from which to end the query.
+        flex_version (int): Version of Flex Query Service to use (we use version 3).
+    """
+    validate_backfill_dates(from_date, to_date)
+    
+    # Get date intervals
+    date_intervals = default_planner.plan(query_id, from_date, to_date, functools.partial(default_cache.contains, query_id, flex_version=flex_version))
+
+    jobs = [FlexJob(token, query_id, start, end) for start, end in date_intervals]
+    df_list = ibkr_query_many(jobs, flex_version)
+    
+    return pl.concat(df_list)
@@ -0,0 +1,279 @@
+import asyncio
+import io
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import datetime as dt
+from typing import IO, Any, Callable, NamedTuple
+import httpx
+import polars as pl
+import tqdm
+from tools.rate_limit import TokenBucket
+from tools.flex_schemas import SOURCE_SCHEMAS
+from tools.spool import CHUNK_SIZE, SPOOL_MAX_SIZE
+from tools.http_client import get_async_client
+from tools.cache import FlexCache, default_cache
+from tools.chunking import ChunkPlanner, default_planner
+from tools.polling import FlexReportTooLongError, FlexTimeoutError, PollingStrategy, default_polling
+
+FLEX_BASE_URL = "https://ndcdyn.interactivebrokers.com/AccountManagement/FlexWebService"
+
+class FlexJob(NamedTuple):
+    """A single Flex Query statement to pull from IBKR."""
+    token: str
+    query_id: str
+    from_date: dt.date
+    to_date: dt.date
+
+
+def read_flex_csv(source: str | IO[bytes], dataset: str = None) -> pl.DataFrame:
+    """Read a single-section Flex statement from CSV text or a binary file.
+
+    When the dataset is given, only its source columns are parsed, straight into the
+    dtypes declared in `SOURCE_SCHEMAS`, without a schema inference pass. The section
+    must not contain repeated header rows (see `route_flex_sections`).
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+
+    if dataset is None:
+        return pl.read_csv(source, infer_schema_length=10000)
+
+    schema = SOURCE_SCHEMAS[dataset]
+    return pl.read_csv(source, columns=list(schema), schema_overrides=schema, infer_schema=False)
+
+
+def _parse_statement(job: FlexJob, file: IO[bytes]) -> pl.DataFrame:
+    return read_flex_csv(file)
+
+
+def _count_rows(file: IO[bytes]) -> int:
+    """Count the lines in a statement file and rewind it."""
+    rows = sum(chunk.count(b"\n") for chunk in iter(lambda: file.read(CHUNK_SIZE), b""))
+    file.seek(0)
+    return rows
+
+
+def _parse_error(body: bytes) -> tuple[str, str]:
+    root = ET.fromstring(body)
+    return root.findtext('ErrorCode'), root.findtext('ErrorMessage')
+
+
+async def _send_request(client: httpx.AsyncClient, bucket: TokenBucket, job: FlexJob, flex_version: int, retry_wait: float) -> str:
+    """Call the SendRequest endpoint and return the statement reference code."""
+    send_params = {
+        "t": job.token,
+        "q": job.query_id,
+        "v": flex_version,
+        "fd": job.from_date.strftime("%Y%m%d"),
+        "td": job.to_date.strftime("%Y%m%d"),
+    }
+
+    while True:
+        await bucket.acquire()
+        send_response = await client.get(url=FLEX_BASE_URL + "/SendRequest", params=send_params)
+
+        if send_response.status_code != 200:
+            raise Exception("Failed to send request:", send_response.text)
+
+        root = ET.fromstring(send_response.text)
+
+        if root.findtext('Status') == 'Success':
+            return root.findtext('ReferenceCode')
+
+        error_code = root.findtext('ErrorCode')
+        error_message = root.findtext('ErrorMessage')
+
+        match error_code:
+
+            # Too many requests for this token, wait for the limit to reset.
+            case "1018":
+                await asyncio.sleep(retry_wait)
+
+            case _:
+                raise Exception("Failed to send request:", job.query_id, error_code, error_message)
+
+
+async def _get_statement(client: httpx.AsyncClient, bucket: TokenBucket, job: FlexJob, reference_code: str, flex_version: int, polling: PollingStrategy) -> tuple[IO[bytes], float]:
+    """Poll the GetStatement endpoint until the report is generated.
+
+    The CSV body is streamed into a spooled temporary file, which is returned rewound
+    along with an estimate of the seconds IBKR took to generate it. The report became
+    ready between the last poll that was still pending and the first that returned it,
+    so the estimate is the midpoint of the two, which leaves out the time spent waiting
+    on the token bucket and the download itself.
+    """
+    receive_params = {
+        "t": job.token,
+        "q": reference_code,
+        "v": flex_version,
+    }
+    sent_at = time.monotonic()
+    pending_at = 0.0
+    generating_since = None
+
+    for wait in polling.waits(job.query_id):
+        if time.monotonic() + wait - sent_at > polling.deadline:
+            raise FlexTimeoutError(f"Statement for query {job.query_id} ({job.from_date}-{job.to_date}) not generated within {polling.deadline} seconds.", polling.deadline)
+
+        await asyncio.sleep(wait)
+        await bucket.acquire()
+        polled_at = time.monotonic() - sent_at
+
+        async with client.stream("GET", url=FLEX_BASE_URL + "/GetStatement", params=receive_params) as receive_response:
+
+            if receive_response.status_code != 200:
+                await receive_response.aread()
+                raise Exception("Failed to send request:", receive_response.text)
+
+            chunks = receive_response.aiter_bytes(chunk_size=CHUNK_SIZE)
+            first_chunk = await anext(chunks, b"")
+
+            # CSV response
+            if not first_chunk.startswith(b"<"):
+                file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+                file.write(first_chunk)
+
+                async for chunk in chunks:
+                    file.write(chunk)
+
+                file.seek(0)
+                seconds = (pending_at + polled_at) / 2
+                polling.record(job.query_id, seconds)
+                return file, seconds
+
+            # XML response
+            body = first_chunk + b"".join([chunk async for chunk in chunks])
+
+        error_code, error_message = _parse_error(body)
+        pending_at = polled_at
+
+        match error_code:
+
+            # Statement generation in progress. One that stays in progress past `too_long` is split.
+            case "1019":
+                generating_since = polled_at if generating_since is None else generating_since
+
+                if polled_at - generating_since > polling.too_long:
+                    raise FlexReportTooLongError(f"Statement for query {job.query_id} ({job.from_date}-{job.to_date}) still generating after {polling.too_long} seconds.", polled_at)
+
+            case "1018" | "1021":
+                continue
+
+            case _:
+                raise Exception("Failed to send request:", job.query_id, error_code, error_message)
+
+
+async def ibkr_query_many_async(
+    jobs: list[FlexJob],
+    flex_version: int = 3,
+    rate: float = 1.0,
+    burst: int = 5,
+    max_concurrency: int = 16,
+    retry_wait: float = 5.0,
+    polling: PollingStrategy = default_polling,
+    parse: Callable[[FlexJob, IO[bytes]], Any] = None,
+    cache: FlexCache | None = default_cache,
+    planner: ChunkPlanner | None = default_planner,
+) -> list[Any]:
+    """Pull many Flex Query statements from IBKR concurrently.
+
+    All SendRequest calls and GetStatement polls share a single token bucket,
+    so the rate limit holds no matter how many jobs are in flight.
+
+    Args:
+        jobs (list[FlexJob]): Statements to pull.
+        flex_version (int): Version of Flex Query Service to use (we use version 3).
+        rate (float): Requests per second allowed across all jobs.
+        burst (int): Maximum number of requests that can be sent back to back.
+        max_concurrency (int): Maximum number of jobs in flight at once.
+        retry_wait (float): Seconds to wait before resending a rate limited SendRequest.
+        polling (PollingStrategy): Schedule for polling GetStatement while reports generate.
+        parse (Callable[[FlexJob, IO[bytes]], Any]): Called in a worker thread with each job and
+            its downloaded statement file. Defaults to reading it into a single dataframe.
+        cache (FlexCache): Local cache of raw statements. Cached jobs never call IBKR,
+            so reruns only pull the statements that failed. Pass None to disable.
+        planner (ChunkPlanner): Learns generation time per query from every statement pulled.
+            Jobs that time out, or that IBKR is still generating after `polling.too_long`
+            seconds, are split in half and retried. Pass None to disable.
+
+    Raises:
+        ExceptionGroup: Once every job has finished, if any of them failed. Statements that
+            succeeded have been parsed (and cached) by then.
+
+    Returns:
+        list[Any]: Parsed statements in the same order as `jobs`. A job that was split
+            contributes one result per piece, in date order.
+    """
+    if parse is None:
+        parse = _parse_statement
+
+    bucket = TokenBucket(rate=rate, capacity=burst)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    progress = tqdm.tqdm(total=len(jobs), desc="Pulling data from IBKR")
+
+    async def run(client: httpx.AsyncClient, job: FlexJob) -> list[Any]:
+        cache_key = (job.query_id, job.from_date, job.to_date, flex_version)
+        file = cache.get(*cache_key) if cache is not None else None
+
+        if file is None:
+            async with semaphore:
+                reference_code = await _send_request(client, bucket, job, flex_version, retry_wait)
+
+                try:
+                    file, seconds = await _get_statement(client, bucket, job, reference_code, flex_version, polling)
+
+                # Timed out or still generating after too long: the window is too big for one statement.
+                except FlexTimeoutError as error:
+                    pieces = planner.split(job.from_date, job.to_date) if planner is not None else []
+                    if len(pieces) < 2:
+                        raise
+
+                    planner.record_timeout(job.query_id, job.from_date, job.to_date, error.seconds or polling.deadline)
+                    reason = error
+
+            # Retry a window that was too big as two smaller ones.
+            if file is None:
+                print(f"Query {job.query_id} ({job.from_date}-{job.to_date}): {reason} Splitting into {pieces}.")
+                progress.total += len(pieces) - 1
+                return await gather_all([job._replace(from_date=start, to_date=end) for start, end in pieces])
+
+            if planner is not None:
+                rows = await asyncio.to_thread(_count_rows, file)
+                planner.record(job.query_id, job.from_date, job.to_date, seconds, rows)
+
+            if cache is not None:
+                await asyncio.to_thread(cache.put, *cache_key, file)
+                file.seek(0)
+
+        with file:
+            result = await asyncio.to_thread(parse, job, file)
+
+        progress.update(1)
+        return [result]
+
+    async def gather_all(jobs: list[FlexJob]) -> list[Any]:
+        # Every job runs to completion even when others fail, so no pulled statement is lost.
+        results = await asyncio.gather(*[run(client, job) for job in jobs], return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+
+        errors = [result for result in results if isinstance(result, Exception)]
+
+        if errors:
+            raise ExceptionGroup(f"{len(errors)} of {len(jobs)} Flex statements failed", errors)
+
+        return [result for job_results in results for result in job_results]
+
+    async with get_async_client(max_connections=max_concurrency) as client:
+        try:
+            return await gather_all(jobs)
+        finally:
+            progress.close()
+
+
+def ibkr_query_many(jobs: list[FlexJob], flex_version: int = 3, **kwargs) -> list[Any]:
+    """Synchronous wrapper around `ibkr_query_many_async` for use inside Airflow tasks."""
+    return asyncio.run(ibkr_query_many_async(jobs, flex_version, **kwargs))
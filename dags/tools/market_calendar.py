@@ -0,0 +1,195 @@
+import bisect
+import functools
+import importlib.metadata
+import os
+import polars as pl
+import datetime as dt
+import dateutil.relativedelta as du
+import pandas_market_calendars as mcal
+from tools.settings import STATE_DIR, load_state, save_state
+
+# Range of dates every persisted trading calendar covers.
+CALENDAR_START_DATE = dt.date(2015, 1, 1)
+CALENDAR_YEARS_AHEAD = 2
+
+# Days a persisted calendar is used for before it is rebuilt, to pick up newly announced holidays.
+CALENDAR_MAX_AGE_DAYS = int(os.getenv('CALENDAR_MAX_AGE_DAYS', 30))
+
+# Persisted calendars built by another version of pandas_market_calendars are rebuilt.
+CALENDAR_VERSION = importlib.metadata.version('pandas_market_calendars')
+
+class TradingCalendar:
+    """Sorted index of trading days answering calendar queries by bisection.
+
+    Building the schedule through `pandas_market_calendars` is slow, so a calendar
+    is built once per process (see `get_trading_calendar`) and persisted to disk.
+    Queries outside the calendar rebuild it to cover the date instead of failing.
+
+    Args:
+        trading_days (list[dt.date]): Every trading day in the calendar, sorted.
+        calendar_name (str): Market calendar the days were built from.
+        path (str): JSON file the calendar is persisted to. Nothing is persisted if None.
+    """
+
+    def __init__(self, trading_days: list[dt.date], calendar_name: str = 'NYSE', path: str = None) -> None:
+        self.trading_days = trading_days
+        self.calendar_name = calendar_name
+        self.path = path
+
+    @staticmethod
+    def _schedule(start_date: dt.date, end_date: dt.date, calendar_name: str) -> list[dt.date]:
+        calendar = mcal.get_calendar(calendar_name)
+        schedule = calendar.schedule(start_date=start_date.isoformat(), end_date=end_date.isoformat())
+        return sorted(schedule.index.date.tolist())
+
+    @classmethod
+    def build(cls, start_date: dt.date, end_date: dt.date, calendar_name: str = 'NYSE', path: str = None) -> 'TradingCalendar':
+        calendar = cls(cls._schedule(start_date, end_date, calendar_name), calendar_name, path)
+        calendar.save()
+        return calendar
+
+    @classmethod
+    def load(cls, path: str, calendar_name: str = 'NYSE') -> 'TradingCalendar | None':
+        """Load a persisted calendar, or return None when it is missing, stale or from another library version."""
+        state = load_state(path)
+
+        if not isinstance(state, dict) or state.get('version') != CALENDAR_VERSION:
+            return None
+
+        if dt.date.today() - dt.date.fromisoformat(state['built_at']) > dt.timedelta(days=CALENDAR_MAX_AGE_DAYS):
+            return None
+
+        return cls([dt.date.fromisoformat(day) for day in state['trading_days']], calendar_name, path)
+
+    def save(self) -> None:
+        save_state(self.path, {
+            'version': CALENDAR_VERSION,
+            'built_at': dt.date.today().isoformat(),
+            'trading_days': [day.isoformat() for day in self.trading_days],
+        })
+
+    @property
+    def start_date(self) -> dt.date:
+        return self.trading_days[0]
+
+    @property
+    def end_date(self) -> dt.date:
+        return self.trading_days[-1]
+
+    def _check_range(self, date: dt.date) -> None:
+        """Rebuild the calendar to cover date when it falls outside of it."""
+        if self.start_date <= date <= self.end_date:
+            return
+
+        start_date, end_date = min(self.start_date, date), max(self.end_date, date)
+        print(f"{date} is outside of the {self.calendar_name} trading calendar, rebuilding it from {start_date} to {end_date}.")
+
+        self.trading_days = self._schedule(start_date, end_date, self.calendar_name)
+        self.save()
+
+    def is_trading_day(self, date: dt.date) -> bool:
+        i = bisect.bisect_left(self.trading_days, date)
+        return i < len(self.trading_days) and self.trading_days[i] == date
+
+    def get_trading_days(self, start_date: dt.date, end_date: dt.date) -> list[dt.date]:
+        """Trading days between start_date and end_date (inclusive)."""
+        self._check_range(start_date)
+        self._check_range(end_date)
+
+        return self.trading_days[bisect.bisect_left(self.trading_days, start_date):bisect.bisect_right(self.trading_days, end_date)]
+
+    def last_market_date(self, reference_date: dt.date) -> dt.date:
+        """The most recent trading day on or before reference_date."""
+        self._check_range(reference_date)
+
+        i = bisect.bisect_right(self.trading_days, reference_date)
+        if i == 0:
+            raise ValueError(f"No market days found before or on {reference_date}")
+
+        return self.trading_days[i - 1]
+
+    def next_trading_day(self, date: dt.date) -> dt.date:
+        """The first trading day strictly after date."""
+        self._check_range(date)
+
+        i = bisect.bisect_right(self.trading_days, date)
+        if i == len(self.trading_days):
+            raise ValueError(f"No market days found after {date}")
+
+        return self.trading_days[i]
+
+    def month_intervals(self, start_date: dt.date, end_date: dt.date) -> list[tuple[dt.date, dt.date]]:
+        """Split start_date to end_date into month-sized intervals aligned to trading days."""
+        self._check_range(start_date)
+        self._check_range(end_date)
+
+        chunks = []
+        month_start = start_date
+
+        while month_start <= end_date:
+            # Determine calendar month end
+            month_end = month_start.replace(day=1) + du.relativedelta(months=1) - dt.timedelta(days=1)
+
+            lo = bisect.bisect_left(self.trading_days, month_start)
+            hi = bisect.bisect_right(self.trading_days, min(month_end, end_date))
+
+            if lo < hi:
+                chunks.append((self.trading_days[lo], self.trading_days[hi - 1]))
+
+            month_start = month_end + dt.timedelta(days=1)
+
+        return chunks
+
+
+@functools.cache
+def get_trading_calendar(calendar_name: str = 'NYSE') -> TradingCalendar:
+    """Get the process-wide trading calendar, loading it from disk when it is up to date."""
+    path = os.path.join(STATE_DIR, 'calendars', f"{calendar_name}.json")
+    end_date = dt.date.today() + du.relativedelta(years=CALENDAR_YEARS_AHEAD)
+
+    calendar = TradingCalendar.load(path, calendar_name)
+
+    # Rebuild once the persisted calendar gets within a year of running out.
+    if calendar is not None and calendar.end_date >= dt.date.today() + du.relativedelta(years=1):
+        return calendar
+
+    return TradingCalendar.build(CALENDAR_START_DATE, end_date, calendar_name, path)
+
+def _get_trading_days(start_date: dt.date, end_date: dt.date, calendar_name='NYSE') -> list[dt.date]:
+    """
+    Retrieve all valid trading days between two dates for a given market calendar.
+
+    Args:
+        start_date (datetime.date): The first date to include in the search range.
+        end_date (datetime.date): The last date to include in the search range.
+        calendar_name (str, optional): The market calendar identifier used by
+            `pandas_market_calendars` (e.g., 'NYSE', 'NASDAQ'). Defaults to 'NYSE'.
+    """
+    return get_trading_calendar(calendar_name).get_trading_days(start_date, end_date)
+
+def _get_trading_date_intervals(start_date: dt.date, end_date: dt.date, cal_name='NYSE'):
+    """
+    Splits the range from start_date to end_date into month-sized intervals,
+    but aligns both interval start and end to valid trading days.
+    """
+    return get_trading_calendar(cal_name).month_intervals(start_date, end_date)
+
+def get_market_calendar_df(start_date: dt.date, end_date: dt.date, exchange: str = 'NYSE') -> pl.DataFrame:
+    """Trading days between start_date and end_date as a single `date` column dataframe."""
+    return pl.DataFrame({"date": _get_trading_days(start_date, end_date, exchange)}, schema={"date": pl.Date})
+
+def get_last_market_date(exchange: str = 'NYSE', reference_date: dt.date = None) -> dt.date:
+    """
+    Returns the most recent trading day on or before reference_date for the given exchange.
+
+    Args:
+        exchange (str): Exchange calendar name (default 'NYSE').
+        ref_date (datetime.date): Reference date. If None, uses today.
+
+    Returns:
+        datetime.date: The last market trading day on or before ref_date.
+    """
+    if reference_date is None:
+        reference_date = dt.date.today()
+
+    return get_trading_calendar(exchange).last_market_date(reference_date)
@@ -0,0 +1,99 @@
+import bisect
+import os
+import random
+from typing import Iterator
+from tools.settings import STATE_DIR, load_state, save_state
+
+# Upper bounds (in seconds) of the report generation latency histogram buckets.
+LATENCY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377, 610)
+
+class FlexTimeoutError(Exception):
+    """Raised when a statement is not generated before its deadline.
+
+    Args:
+        message (str): Description of the statement that timed out.
+        seconds (float): Seconds spent waiting on the statement before giving up.
+    """
+
+    def __init__(self, message: str, seconds: float = None) -> None:
+        super().__init__(message)
+        self.seconds = seconds
+
+
+class FlexReportTooLongError(FlexTimeoutError):
+    """Raised when IBKR is still generating a statement (error 1019) after `too_long` seconds."""
+
+
+class PollingStrategy:
+    """Adaptive GetStatement polling schedule learned from past generation times.
+
+    Keeps a histogram of report generation latency per query id. The first poll
+    lands near the median latency seen for that query (or `initial_wait` when there
+    is no history yet) and later polls back off exponentially with jitter until
+    the deadline is reached.
+
+    Args:
+        initial_wait (float): Seconds to wait before the first poll of an unseen query.
+        max_wait (float): Longest single wait between polls.
+        backoff (float): Multiplier applied to the wait after every unsuccessful poll.
+        jitter (float): Fraction of each wait that is randomized.
+        deadline (float): Seconds after SendRequest before giving up on a statement.
+        too_long (float): Seconds a statement may keep answering 1019 (generation in progress)
+            before its window is treated as too long to generate in one piece.
+        path (str): JSON file the histograms are persisted to. Nothing is persisted if None.
+    """
+
+    def __init__(
+        self,
+        initial_wait: float = 1.0,
+        max_wait: float = 60.0,
+        backoff: float = 2.0,
+        jitter: float = 0.25,
+        deadline: float = 900.0,
+        too_long: float = 300.0,
+        path: str = None,
+    ) -> None:
+        self.initial_wait = initial_wait
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.too_long = too_long
+        self.path = path
+        self.histograms: dict[str, list[int]] = load_state(path)
+
+    def record(self, query_id: str, latency: float) -> None:
+        """Add an observed generation latency (in seconds) to the query's histogram."""
+        histogram = self.histograms.setdefault(str(query_id), [0] * (len(LATENCY_BUCKETS) + 1))
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+        save_state(self.path, self.histograms)
+
+    def expected_latency(self, query_id: str, quantile: float = 0.5) -> float | None:
+        """Latency bucket that `quantile` of past statements for this query finished within."""
+        histogram = self.histograms.get(str(query_id))
+
+        if not histogram or sum(histogram) == 0:
+            return None
+
+        target = quantile * sum(histogram)
+        seen = 0
+        for i, count in enumerate(histogram):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS[min(i, len(LATENCY_BUCKETS) - 1)]
+
+    def waits(self, query_id: str) -> Iterator[float]:
+        """Yield the seconds to wait before each GetStatement poll."""
+        wait = self.expected_latency(query_id) or self.initial_wait
+
+        while True:
+            yield min(self.max_wait, wait) * (1 + random.uniform(-self.jitter, self.jitter))
+            wait = min(self.max_wait, wait * self.backoff)
+
+
+default_polling = PollingStrategy(
+    deadline=float(os.getenv('IBKR_POLL_DEADLINE', 900)),
+    too_long=float(os.getenv('IBKR_POLL_TOO_LONG', 300)),
+    path=os.path.join(STATE_DIR, 'polling.json'),
+)
@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """Async token bucket used to stay under the IBKR Flex Web Service rate limit.
+
+    Every request sent to IBKR (SendRequest and each GetStatement poll) must acquire
+    a token first, so a single bucket can be shared by any number of concurrent jobs.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (int): Maximum number of tokens that can accumulate (burst size).
+    """
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            self._refill()
+
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+
+            self.tokens -= 1
@@ -0,0 +1,254 @@
+import datetime as dt
+import polars as pl
+
+# Sub categories each source contributes to holding returns. Mirrors holding_returns_materialize.sql.
+POSITION_SUB_CATEGORIES = ['ETF', 'COMMON', 'ADR']
+DIVIDEND_SUB_CATEGORIES = ['ETF', 'COMMON', 'ADR']
+TRADE_SUB_CATEGORIES = ['ETF', 'COMMON', 'ATR']
+
+HOLDING_KEYS = ['client_account_id', 'report_date', 'symbol']
+
+# Decimal places returns are rounded to, as ROUND(..., n) does in the materialize scripts.
+# Both round half away from zero. Floating point and NUMERIC results can still fall on
+# different sides of a rounding boundary, so the engines agree to within one unit of the
+# last place, and a value that lands on a boundary can be rewritten when engines switch.
+RATIO_SCALE = 12
+AMOUNT_SCALE = 6
+
+def _rounded(ratios: list[str], amounts: list[str]) -> list[pl.Expr]:
+    return [
+        pl.col(ratios).round(RATIO_SCALE, mode='half_away_from_zero'),
+        pl.col(amounts).round(AMOUNT_SCALE, mode='half_away_from_zero'),
+    ]
+
+def _between(lf: pl.LazyFrame, column: str, start_date: dt.date = None, end_date: dt.date = None) -> pl.LazyFrame:
+    if start_date is not None:
+        lf = lf.filter(pl.col(column) >= start_date)
+
+    if end_date is not None:
+        lf = lf.filter(pl.col(column) <= end_date)
+
+    return lf
+
+def _holdings(positions: pl.LazyFrame, trades: pl.LazyFrame, dividends: pl.LazyFrame) -> pl.LazyFrame:
+    """One row per (account, date, symbol) held or traded, with the raw positions values."""
+    positions = (
+        positions
+        .filter(pl.col('sub_category').is_in(POSITION_SUB_CATEGORIES))
+        .select(
+            *HOLDING_KEYS,
+            pl.col('fx_rate_to_base').cast(pl.Float64).alias('fx_rate_1'),
+            pl.col('quantity').cast(pl.Float64).alias('shares_1'),
+            pl.col('mark_price').cast(pl.Float64).alias('price_1'),
+        )
+    )
+
+    dividends = (
+        dividends
+        .filter(pl.col('sub_category').is_in(DIVIDEND_SUB_CATEGORIES))
+        .group_by(HOLDING_KEYS)
+        .agg(
+            pl.col('net_amount').cast(pl.Float64).sum().alias('dividends'),
+            pl.col('gross_rate').cast(pl.Float64).sum().alias('dividends_per_share'),
+        )
+    )
+
+    trades = (
+        trades
+        .filter(pl.col('sub_category').is_in(TRADE_SUB_CATEGORIES))
+        .with_columns(pl.col('quantity', 'trade_price').cast(pl.Float64))
+        .group_by(HOLDING_KEYS)
+        .agg(
+            pl.col('quantity').sum().alias('shares_traded'),
+            ((pl.col('quantity') * pl.col('trade_price')).sum() / pl.col('quantity').sum()).alias('average_trade_price'),
+        )
+        .filter(pl.col('shares_traded') != 0)
+    )
+
+    base = pl.concat([positions.select(HOLDING_KEYS), trades.select(HOLDING_KEYS)]).unique()
+
+    return (
+        base
+        .join(positions, on=HOLDING_KEYS, how='left')
+        .join(dividends, on=HOLDING_KEYS, how='left')
+        .join(trades, on=HOLDING_KEYS, how='left')
+        .with_columns(pl.col('dividends', 'dividends_per_share', 'shares_traded', 'average_trade_price').fill_null(0))
+    )
+
+def holding_returns(
+    positions: pl.LazyFrame,
+    trades: pl.LazyFrame,
+    dividends: pl.LazyFrame,
+    calendar: pl.LazyFrame,
+    start_date: dt.date = None,
+    end_date: dt.date = None,
+) -> pl.LazyFrame:
+    """Daily return of every holding, in the shape of the holding_returns table.
+
+    Vectorized equivalent of holding_returns_materialize.sql. The prior day of each
+    (account, symbol) is its previous row in the frames, so they should start before
+    start_date for the first day of the window to be lagged.
+
+    Args:
+        positions (pl.LazyFrame): Cleaned positions.
+        trades (pl.LazyFrame): Cleaned trades.
+        dividends (pl.LazyFrame): Cleaned dividends.
+        calendar (pl.LazyFrame): Market dates, in a `date` column.
+        start_date (dt.date): First date returned (inclusive). Unbounded if None.
+        end_date (dt.date): Last date returned (inclusive). Unbounded if None.
+    """
+    holdings = _holdings(positions, trades, dividends).sort(HOLDING_KEYS)
+
+    def lagged(column: str) -> pl.Expr:
+        # Lags the raw value, like LAG(...) OVER (PARTITION BY client_account_id, symbol ORDER BY report_date).
+        return pl.col(column).shift(1).over('client_account_id', 'symbol').fill_null(pl.col(column))
+
+    shift = holdings.select(
+        *HOLDING_KEYS,
+        pl.col('fx_rate_1').fill_null(0),
+        pl.col('shares_1').fill_null(0),
+        pl.col('price_1').fill_null(pl.col('average_trade_price')),
+        'dividends',
+        'dividends_per_share',
+        'shares_traded',
+        'average_trade_price',
+        lagged('fx_rate_1').alias('fx_rate_0'),
+        lagged('shares_1').alias('shares_0'),
+        lagged('price_1').alias('price_0'),
+    )
+
+    initial_trade = (pl.col('shares_1') - pl.col('shares_traded')) == 0
+    exit_trade = pl.col('shares_1') == 0
+
+    adjustments = shift.select(
+        *HOLDING_KEYS,
+        'shares_0',
+        'shares_1',
+        'shares_traded',
+        'average_trade_price',
+        'dividends',
+        'dividends_per_share',
+        pl.when(initial_trade).then(pl.col('shares_1'))
+            .when(exit_trade).then(pl.col('shares_0'))
+            .otherwise(pl.col('shares_1') - pl.col('shares_traded'))
+            .alias('shares_1_adj'),
+        pl.when(initial_trade).then(pl.col('average_trade_price') * pl.col('fx_rate_0'))
+            .otherwise(pl.col('price_0') * pl.col('fx_rate_0'))
+            .alias('price_0'),
+        pl.when(exit_trade).then(pl.col('average_trade_price') * pl.col('fx_rate_0'))
+            .otherwise(pl.col('price_1') * pl.col('fx_rate_1'))
+            .alias('price_1'),
+    )
+
+    market_value = pl.col('shares_1') * pl.col('price_1')
+
+    returns = (
+        adjustments
+        .join(calendar.select('date'), left_on='report_date', right_on='date', how='inner')
+        .select(
+            pl.col('report_date').alias('date'),
+            'client_account_id',
+            pl.col('symbol').alias('ticker'),
+            (market_value / market_value.sum().over('client_account_id', 'report_date')).alias('weight'),
+            pl.when(exit_trade).then(pl.col('shares_0')).otherwise(pl.col('shares_1')).alias('shares'),
+            pl.col('price_1').alias('price'),
+            'shares_traded',
+            'average_trade_price',
+            ((pl.col('shares_1_adj') * pl.col('price_1') + pl.col('dividends')) / (pl.col('shares_0') * pl.col('price_0')) - 1).alias('return'),
+            'dividends',
+            'dividends_per_share',
+        )
+        .with_columns((pl.col('shares') * pl.col('price')).alias('value'))
+    )
+
+    return _between(returns, 'date', start_date, end_date).select(
+        'date', 'client_account_id', 'ticker', 'weight', 'shares', 'price', 'value',
+        'shares_traded', 'average_trade_price', 'return', 'dividends', 'dividends_per_share',
+    ).with_columns(
+        *_rounded(['weight', 'return'], ['shares', 'price', 'value', 'shares_traded', 'average_trade_price', 'dividends', 'dividends_per_share'])
+    )
+
+def holding_state(positions: pl.LazyFrame, trades: pl.LazyFrame, dividends: pl.LazyFrame, end_date: dt.date = None) -> pl.LazyFrame:
+    """Last row of each (account, symbol) up to end_date, in the shape of the holding_state table."""
+    holdings = _between(_holdings(positions, trades, dividends), 'report_date', end_date=end_date)
+
+    return (
+        holdings
+        .sort(HOLDING_KEYS)
+        .unique(subset=['client_account_id', 'symbol'], keep='last')
+        .select(
+            'client_account_id',
+            'symbol',
+            'report_date',
+            pl.col('shares_1').alias('shares'),
+            pl.col('price_1').alias('price'),
+            pl.col('fx_rate_1').alias('fx_rate'),
+        )
+    )
+
+def _fund_values(delta_nav: pl.LazyFrame, calendar: pl.LazyFrame) -> pl.LazyFrame:
+    return (
+        delta_nav
+        .join(calendar.select('date'), on='date', how='inner')
+        .select(
+            'date',
+            'client_account_id',
+            pl.col('ending_value', 'deposits_withdrawals', 'dividends').cast(pl.Float64),
+        )
+        .sort('client_account_id', 'date')
+        .with_columns(
+            pl.col('ending_value').shift(1).over('client_account_id').fill_null(pl.col('ending_value')).alias('starting_value')
+        )
+    )
+
+def fund_returns(delta_nav: pl.LazyFrame, calendar: pl.LazyFrame, start_date: dt.date = None, end_date: dt.date = None) -> pl.LazyFrame:
+    """Daily return of every fund, in the shape of the fund_returns table.
+
+    Vectorized equivalent of fund_returns_materialize.sql.
+
+    Args:
+        delta_nav (pl.LazyFrame): Cleaned delta NAV.
+        calendar (pl.LazyFrame): Market dates, in a `date` column.
+        start_date (dt.date): First date returned (inclusive). Unbounded if None.
+        end_date (dt.date): Last date returned (inclusive). Unbounded if None.
+    """
+    value = pl.col('ending_value') - pl.col('deposits_withdrawals')
+
+    returns = _fund_values(delta_nav, calendar).select(
+        'date',
+        'client_account_id',
+        value.alias('value'),
+        (value / pl.col('starting_value') - 1).alias('return'),
+        'dividends',
+    ).with_columns(*_rounded(['return'], ['value', 'dividends']))
+
+    return _between(returns, 'date', start_date, end_date)
+
+def all_fund_returns(delta_nav: pl.LazyFrame, calendar: pl.LazyFrame, start_date: dt.date = None, end_date: dt.date = None) -> pl.LazyFrame:
+    """Daily return of all funds combined, in the shape of the all_fund_returns table.
+
+    Vectorized equivalent of all_fund_returns_materialize.sql.
+
+    Args:
+        delta_nav (pl.LazyFrame): Cleaned delta NAV.
+        calendar (pl.LazyFrame): Market dates, in a `date` column.
+        start_date (dt.date): First date returned (inclusive). Unbounded if None.
+        end_date (dt.date): Last date returned (inclusive). Unbounded if None.
+    """
+    value = pl.col('ending_value') - pl.col('deposits_withdrawals')
+
+    returns = (
+        _fund_values(delta_nav, calendar)
+        .group_by('date')
+        .agg(pl.col('starting_value', 'ending_value', 'deposits_withdrawals', 'dividends').sum())
+        .select(
+            'date',
+            value.alias('value'),
+            (value / pl.col('starting_value') - 1).alias('return'),
+            'dividends',
+        )
+        .sort('date')
+        .with_columns(*_rounded(['return'], ['value', 'dividends']))
+    )
+
+    return _between(returns, 'date', start_date, end_date)
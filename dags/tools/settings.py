@@ -0,0 +1,37 @@
+import json
+import os
+import tempfile
+
+# Directory for state the IBKR tools keep between task runs on a worker.
+STATE_DIR = os.getenv('IBKR_STATE_DIR', os.path.join(tempfile.gettempdir(), 'ibkr'))
+
+def load_state(path: str | None) -> dict:
+    """Read a JSON state file, or return an empty dict when it is missing or corrupt."""
+    if path is None or not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    except json.JSONDecodeError:
+        print(f"Ignoring corrupt state file {path}.")
+        return {}
+
+def save_state(path: str | None, state: dict) -> None:
+    """Write a JSON state file atomically, so concurrent readers never see a partial file."""
+    if path is None:
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), suffix='.tmp', delete=False) as temp_file:
+        try:
+            json.dump(state, temp_file)
+
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_file.name)
+            raise
+
+    os.replace(temp_file.name, path)
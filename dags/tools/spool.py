@@ -0,0 +1,26 @@
+import tempfile
+from typing import IO, Iterable
+
+# Bytes read from the network per chunk when streaming statements.
+CHUNK_SIZE = 1024 * 1024
+
+# Bytes held in memory before a spooled file rolls over to disk.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+def spool_chunks(chunks: Iterable[bytes]) -> IO[bytes]:
+    """Write a stream of byte chunks to a spooled temporary file.
+
+    Small statements stay in memory while large ones roll over to disk,
+    so peak memory is bounded no matter how big the statement is.
+
+    Returns:
+        IO[bytes]: The spooled file, rewound to the start. Close it (or use it
+            as a context manager) to free the memory or disk space.
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    for chunk in chunks:
+        file.write(chunk)
+
+    file.seek(0)
+    return file